@@ -1,5 +1,14 @@
-import anthropic
-from typing import List, Optional, Dict, Any
+import asyncio
+import hashlib
+from collections import OrderedDict
+from functools import lru_cache
+from types import MappingProxyType
+from typing import TYPE_CHECKING, AsyncIterator, List, Optional, Dict, Any, Tuple
+
+# The anthropic SDK is imported lazily (when the first client is built) so
+# importing this module stays cheap, e.g. for tests that mock AIGenerator
+if TYPE_CHECKING:
+    import anthropic
 
 class AIGenerator:
     """Handles interactions with Anthropic's Claude API for generating responses"""
@@ -29,11 +38,41 @@ All responses must be:
 Provide only the direct answer to what was asked.
 """
 
+    # Prompt-caching breakpoint on the static system prompt. The cached prefix
+    # runs tools -> system -> messages, so this one breakpoint covers the tool
+    # definitions too; the tools themselves need no breakpoint of their own
+    SYSTEM_BLOCK = {
+        "type": "text",
+        "text": SYSTEM_PROMPT,
+        "cache_control": {"type": "ephemeral"}
+    }
+
     MAX_ROUNDS = 2
 
-    def __init__(self, api_key: str, model: str):
-        self.client = anthropic.Anthropic(api_key=api_key)
+    # Shared read-only tool_choice, so no dict is allocated per call
+    TOOL_CHOICE_AUTO = MappingProxyType({"type": "auto"})
+
+    # Max exact-match responses kept in the per-instance LRU cache
+    RESPONSE_CACHE_SIZE = 512
+
+    # History over this (approximate) token budget is condensed by the summary model
+    MAX_HISTORY_TOKENS = 2000
+    SUMMARY_MAX_TOKENS = 300
+    SUMMARY_CACHE_SIZE = 128
+
+    # Message Batches polling: exponential backoff between these bounds (seconds)
+    BATCH_POLL_INITIAL = 1.0
+    BATCH_POLL_MAX = 60.0
+    _sleep = staticmethod(asyncio.sleep)  # Poll delay hook, patched out in tests
+
+    # One client per API key, shared by all instances so the HTTP
+    # connection pool (and its warm keep-alive connections) is reused
+    _CLIENTS: Dict[str, "anthropic.AsyncAnthropic"] = {}
+
+    def __init__(self, api_key: str, model: str, summary_model: str):
+        self.client = self._client_for(api_key)
         self.model = model
+        self.summary_model = summary_model
 
         # Pre-build base API parameters
         self.base_params = {
@@ -42,10 +81,203 @@ Provide only the direct answer to what was asked.
             "max_tokens": 800
         }
 
-    def generate_response(self, query: str,
-                         conversation_history: Optional[str] = None,
-                         tools: Optional[List] = None,
-                         tool_manager=None) -> str:
+        # Exact-match LRU cache of final answers for tool-free calls
+        self._response_cache: OrderedDict[bytes, str] = OrderedDict()
+
+        # Summaries of individual exchanges from over-budget history
+        self._summary_cache: OrderedDict[str, str] = OrderedDict()
+
+    @classmethod
+    def _client_for(cls, api_key: str) -> "anthropic.AsyncAnthropic":
+        """Return the shared client for api_key, creating it on first use"""
+        client = cls._CLIENTS.get(api_key)
+        if client is None:
+            import anthropic
+            import httpx
+            import orjson
+
+            class OrjsonHttpxClient(anthropic.DefaultAsyncHttpxClient):
+                """Encodes JSON request bodies with orjson instead of the stdlib encoder"""
+
+                def build_request(self, method, url, *, content=None, json=None, **kwargs):
+                    if json is not None and content is None:
+                        content, json = orjson.dumps(json), None
+                    return super().build_request(method, url, content=content, json=json, **kwargs)
+
+            # Keep the SDK's pool bounds; only hold idle connections open longer
+            defaults = anthropic.DEFAULT_CONNECTION_LIMITS
+            limits = httpx.Limits(
+                max_connections=defaults.max_connections,
+                max_keepalive_connections=defaults.max_keepalive_connections,
+                keepalive_expiry=30
+            )
+            client = anthropic.AsyncAnthropic(
+                api_key=api_key,
+                max_retries=2,
+                http_client=OrjsonHttpxClient(limits=limits)
+            )
+            cls._CLIENTS[api_key] = client
+        return client
+
+    @staticmethod
+    def _cache_key(query: str, conversation_history: Optional[str],
+                   tools: Optional[List[Dict[str, Any]]]) -> bytes:
+        """Hash the inputs that fully determine a tool-free response"""
+        tools_sig = ",".join(tool.get("name", "") for tool in tools or [])
+        raw = f"{query}\0{conversation_history or ''}\0{tools_sig}"
+        return hashlib.blake2b(raw.encode(), digest_size=16).digest()
+
+    def _cache_response(self, key: bytes, text: str) -> str:
+        """Store a final answer, evicting the least recently used entry when full"""
+        self._response_cache[key] = text
+        if len(self._response_cache) > self.RESPONSE_CACHE_SIZE:
+            self._response_cache.popitem(last=False)
+        return text
+
+    @staticmethod
+    def _execute_tool(tool_manager, block) -> str:
+        """Run one tool_use block, returning errors as a readable string"""
+        try:
+            return tool_manager.execute_tool(block.name, **block.input)
+        except Exception as e:
+            return f"Tool execution error: {e}"
+
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _compose_system(conversation_history: Optional[str]) -> Tuple[Dict[str, Any], ...]:
+        """
+        Build the system blocks for a given history, memoized so a session
+        reusing the same history string skips rebuilding the history block.
+
+        The static prompt is its own cacheable block; history goes in a
+        separate uncached block so the cached prefix stays byte-identical
+        across calls. The result is shared between calls and must not be
+        mutated.
+        """
+        if not conversation_history:
+            return (AIGenerator.SYSTEM_BLOCK,)
+        return (AIGenerator.SYSTEM_BLOCK, {
+            "type": "text",
+            "text": f"Previous conversation:\n{conversation_history}"
+        })
+
+    async def _fit_history(self, conversation_history: Optional[str]) -> Optional[str]:
+        """
+        Keep conversation history within MAX_HISTORY_TOKENS.
+
+        Tokens are approximated as len // 4. Over budget, every exchange before
+        the latest is replaced by a short summary from the summary model; the
+        latest exchange is kept verbatim. Exchanges are summarized one at a
+        time so that, as the history window slides, only the exchange that
+        just aged out needs a new summary. If summarization fails, the older
+        exchanges are dropped instead.
+        """
+        if not conversation_history or len(conversation_history) // 4 <= self.MAX_HISTORY_TOKENS:
+            return conversation_history
+
+        exchanges = conversation_history.split("\nUser: ")
+        exchanges[1:] = [f"User: {exchange}" for exchange in exchanges[1:]]
+        earlier, latest = (exchanges[:-1], exchanges[-1]) if len(exchanges) > 1 else (exchanges, "")
+
+        try:
+            summaries = await asyncio.gather(*(self._summarize(exchange) for exchange in earlier))
+        except Exception:
+            return latest or conversation_history[-self.MAX_HISTORY_TOKENS * 4:]
+
+        summary = " ".join(summaries)
+        return "\n".join(filter(None, [f"Summary of earlier conversation: {summary}", latest]))
+
+    async def _summarize(self, exchange: str) -> str:
+        """Summarize one exchange with the summary model, reusing cached summaries"""
+        summary = self._summary_cache.get(exchange)
+        if summary is not None:
+            self._summary_cache.move_to_end(exchange)
+            return summary
+
+        response = await self.client.messages.create(
+            model=self.summary_model,
+            max_tokens=self.SUMMARY_MAX_TOKENS,
+            temperature=0,
+            messages=[{
+                "role": "user",
+                "content": "Summarize this conversation exchange in at most "
+                           f"{self.SUMMARY_MAX_TOKENS} tokens. Keep the facts needed "
+                           f"to answer follow-up questions.\n\n{exchange}"
+            }]
+        )
+        summary = self._first_text(response)
+        self._summary_cache[exchange] = summary
+        if len(self._summary_cache) > self.SUMMARY_CACHE_SIZE:
+            self._summary_cache.popitem(last=False)
+        return summary
+
+    def _build_api_params(self, query: str,
+                          conversation_history: Optional[str],
+                          tools: Optional[List]) -> Dict[str, Any]:
+        """Assemble first-round API parameters shared by every call path"""
+        api_params = {
+            **self.base_params,
+            "messages": [{"role": "user", "content": query}],
+            "system": self._compose_system(conversation_history)
+        }
+
+        # Add tools if available; SYSTEM_BLOCK's breakpoint caches them along
+        # with the system prompt across every round
+        if tools:
+            api_params["tools"] = tools
+            api_params["tool_choice"] = self.TOOL_CHOICE_AUTO
+
+        return api_params
+
+    async def _run_tools(self, response, tool_manager) -> List[Dict[str, Any]]:
+        """Execute every tool_use block in a response and build tool_result blocks"""
+        # Tools do blocking work (vector search, embedding), so every call runs
+        # on a worker thread to keep the event loop free for other requests;
+        # calls in the same round run concurrently and gather keeps results
+        # in tool_use order.
+        uses = [block for block in response.content if block.type == "tool_use"]
+        results = await asyncio.gather(*(
+            asyncio.to_thread(self._execute_tool, tool_manager, block)
+            for block in uses
+        ))
+
+        return [
+            {"type": "tool_result", "tool_use_id": block.id, "content": result}
+            for block, result in zip(uses, results)
+        ]
+
+    @staticmethod
+    def _append_tool_round(messages: List[Dict[str, Any]], response,
+                           tool_results: List[Dict[str, Any]]) -> None:
+        """Append a tool round to messages, moving the cache breakpoint to its last tool_result"""
+        # Only the newest round carries a breakpoint: the cache lookup walks back
+        # from it to earlier rounds, and a request may have at most four
+        # breakpoints (SYSTEM_BLOCK already uses one).
+        for message in messages:
+            if message["role"] == "user" and isinstance(message["content"], list):
+                for block in message["content"]:
+                    block.pop("cache_control", None)
+        tool_results[-1]["cache_control"] = {"type": "ephemeral"}
+        messages.append({"role": "assistant", "content": response.content})
+        messages.append({"role": "user", "content": tool_results})
+
+    @staticmethod
+    def _first_text(response) -> str:
+        """Text of the first text block in a response, or "" if there is none"""
+        return next((block.text for block in response.content
+                     if getattr(block, "type", "") == "text"), "")
+
+    @staticmethod
+    def _drop_tools(api_params: Dict[str, Any]) -> Dict[str, Any]:
+        """Remove tools in place to force a text-only answer; api_params is reused, not copied"""
+        api_params.pop("tools", None)
+        api_params.pop("tool_choice", None)
+        return api_params
+
+    async def generate_response(self, query: str,
+                               conversation_history: Optional[str] = None,
+                               tools: Optional[List] = None,
+                               tool_manager=None) -> str:
         """
         Generate AI response with optional tool usage and conversation context.
 
@@ -59,58 +291,150 @@ Provide only the direct answer to what was asked.
             Generated response as string
         """
 
-        # Build system content efficiently - avoid string ops when possible
-        system_content = (
-            f"{self.SYSTEM_PROMPT}\n\nPrevious conversation:\n{conversation_history}"
-            if conversation_history
-            else self.SYSTEM_PROMPT
-        )
-
-        messages = [{"role": "user", "content": query}]
-
-        # Prepare API call parameters
-        api_params = {
-            **self.base_params,
-            "messages": messages,
-            "system": system_content
-        }
+        # Answers that depend on tool output (and their sources) can change,
+        # so only tool-free calls are served from the exact-match cache
+        cache_key = None
+        if tool_manager is None:
+            cache_key = self._cache_key(query, conversation_history, tools)
+            cached = self._response_cache.get(cache_key)
+            if cached is not None:
+                self._response_cache.move_to_end(cache_key)
+                return cached
 
-        # Add tools if available
-        if tools:
-            api_params["tools"] = tools
-            api_params["tool_choice"] = {"type": "auto"}
+        conversation_history = await self._fit_history(conversation_history)
+        # Without a tool_manager no tool can run, so don't pay for sending
+        # tool schemas; the loop then ends after a single round
+        api_params = self._build_api_params(
+            query, conversation_history, tools if tool_manager is not None else None
+        )
+        messages = api_params["messages"]
 
         for _ in range(self.MAX_ROUNDS):
-            response = self.client.messages.create(**api_params)
+            response = await self.client.messages.create(**api_params)
 
             # If Claude is done (no tool use), return immediately
             if response.stop_reason != "tool_use" or not tool_manager:
+                if cache_key is not None:
+                    return self._cache_response(cache_key, response.content[0].text)
                 return response.content[0].text
 
             # Execute all tool calls, catching errors as strings
-            tool_results = []
-            for block in response.content:
-                if block.type == "tool_use":
-                    try:
-                        result = tool_manager.execute_tool(block.name, **block.input)
-                    except Exception as e:
-                        result = f"Tool execution error: {e}"
-                    tool_results.append({
-                        "type": "tool_result",
-                        "tool_use_id": block.id,
-                        "content": result
-                    })
-
-            # Accumulate conversation context; tools stay in api_params for next round
-            messages.append({"role": "assistant", "content": response.content})
-            messages.append({"role": "user", "content": tool_results})
-            api_params["messages"] = messages
+            tool_results = await self._run_tools(response, tool_manager)
+
+            # stop_reason said tool_use but there was nothing to run — answer
+            # with this round's text rather than spending another round-trip
+            if not tool_results:
+                return self._first_text(response)
+
+            # Accumulate conversation context in place; api_params already holds
+            # this list, so the system + tools prefix is reused untouched
+            self._append_tool_round(messages, response, tool_results)
 
         # MAX_ROUNDS exhausted — force a text answer without tools
-        final_params = {
-            **self.base_params,
-            "messages": messages,
-            "system": system_content
-        }
-        final_response = self.client.messages.create(**final_params)
+        final_response = await self.client.messages.create(**self._drop_tools(api_params))
         return final_response.content[0].text
+
+    async def generate_response_stream(self, query: str,
+                                       conversation_history: Optional[str] = None,
+                                       tools: Optional[List] = None,
+                                       tool_manager=None) -> AsyncIterator[Optional[str]]:
+        """
+        Streaming variant of generate_response that yields answer text as it arrives.
+
+        Every round is streamed: text deltas are forwarded as they arrive and
+        the assembled final message decides whether tools need to run before
+        the next round. The force-answer call after MAX_ROUNDS is streamed too.
+        Text from a round that ends in tool use is only a preamble (e.g. "Let
+        me search..."), which generate_response never returns, so it is
+        retracted by yielding None once the round turns out to call tools.
+
+        Args:
+            query: The user's question or request
+            conversation_history: Previous messages for context
+            tools: Available tools the AI can use
+            tool_manager: Manager to execute tools
+
+        Yields:
+            Chunks of the generated response text, or None to discard every
+            chunk yielded so far
+        """
+        if tool_manager is None:
+            cache_key = self._cache_key(query, conversation_history, tools)
+            cached = self._response_cache.get(cache_key)
+            if cached is not None:
+                self._response_cache.move_to_end(cache_key)
+                yield cached
+                return
+
+            chunks = []
+            conversation_history = await self._fit_history(conversation_history)
+            api_params = self._build_api_params(query, conversation_history, None)
+            async with self.client.messages.stream(**api_params) as stream:
+                async for text in stream.text_stream:
+                    chunks.append(text)
+                    yield text
+            self._cache_response(cache_key, "".join(chunks))
+            return
+
+        conversation_history = await self._fit_history(conversation_history)
+        api_params = self._build_api_params(query, conversation_history, tools)
+        messages = api_params["messages"]
+
+        for _ in range(self.MAX_ROUNDS):
+            streamed = False
+            async with self.client.messages.stream(**api_params) as stream:
+                async for text in stream.text_stream:
+                    streamed = True
+                    yield text
+                response = await stream.get_final_message()
+
+            if response.stop_reason != "tool_use":
+                return
+
+            tool_results = await self._run_tools(response, tool_manager)
+            if not tool_results:
+                return
+
+            if streamed:
+                yield None
+            self._append_tool_round(messages, response, tool_results)
+
+        # MAX_ROUNDS exhausted — stream the forced text answer
+        async with self.client.messages.stream(**self._drop_tools(api_params)) as stream:
+            async for text in stream.text_stream:
+                yield text
+
+    async def generate_batch(self, queries: List[str]) -> List[str]:
+        """
+        Answer many stateless single-turn queries through the Message Batches API.
+
+        Batches are billed at a discount and give higher throughput, but
+        results arrive asynchronously, so this suits bulk jobs rather than
+        interactive chat. There is no tool loop to run tool calls between
+        rounds, so requests are sent without tools and Claude answers each
+        query directly.
+
+        Args:
+            queries: Questions to answer, one request each
+
+        Returns:
+            Response text per query, in input order ("" for requests that
+            did not succeed)
+        """
+        batch = await self.client.messages.batches.create(requests=[
+            {"custom_id": f"query-{i}", "params": self._build_api_params(query, None, None)}
+            for i, query in enumerate(queries)
+        ])
+
+        delay = self.BATCH_POLL_INITIAL
+        while batch.processing_status != "ended":
+            await self._sleep(delay)
+            delay = min(delay * 2, self.BATCH_POLL_MAX)
+            batch = await self.client.messages.batches.retrieve(batch.id)
+
+        answers = [""] * len(queries)
+        async for entry in await self.client.messages.batches.results(batch.id):
+            if entry.result.type == "succeeded":
+                index = int(entry.custom_id.rsplit("-", 1)[1])
+                answers[index] = self._first_text(entry.result.message)
+        return answers
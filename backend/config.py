@@ -11,6 +11,7 @@ class Config:
     # Anthropic API settings
     ANTHROPIC_API_KEY: str = os.getenv("ANTHROPIC_API_KEY", "")
     ANTHROPIC_MODEL: str = "claude-sonnet-4-20250514"
+    SUMMARY_MODEL: str = "claude-3-5-haiku-20241022"  # Condenses over-budget conversation history
     
     # Embedding model settings
     EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
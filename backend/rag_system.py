@@ -1,4 +1,4 @@
-from typing import List, Tuple, Optional, Dict
+from typing import AsyncIterator, List, Tuple, Optional, Dict
 import os
 from document_processor import DocumentProcessor
 from vector_store import VectorStore
@@ -16,15 +16,21 @@ class RAGSystem:
         # Initialize core components
         self.document_processor = DocumentProcessor(config.CHUNK_SIZE, config.CHUNK_OVERLAP)
         self.vector_store = VectorStore(config.CHROMA_PATH, config.EMBEDDING_MODEL, config.MAX_RESULTS)
-        self.ai_generator = AIGenerator(config.ANTHROPIC_API_KEY, config.ANTHROPIC_MODEL)
+        self.ai_generator = AIGenerator(config.ANTHROPIC_API_KEY, config.ANTHROPIC_MODEL, config.SUMMARY_MODEL)
         self.session_manager = SessionManager(config.MAX_HISTORY)
+    
+    def _new_tool_manager(self) -> ToolManager:
+        """
+        Build a ToolManager with its own search tools for a single query.
         
-        # Initialize search tools
-        self.tool_manager = ToolManager()
-        self.search_tool = CourseSearchTool(self.vector_store)
-        self.tool_manager.register_tool(self.search_tool)
-        self.outline_tool = CourseOutlineTool(self.vector_store)
-        self.tool_manager.register_tool(self.outline_tool)
+        Search tools record the sources of their results, so concurrent
+        queries each need their own instances or they would read (and
+        reset) each other's sources.
+        """
+        tool_manager = ToolManager()
+        tool_manager.register_tool(CourseSearchTool(self.vector_store))
+        tool_manager.register_tool(CourseOutlineTool(self.vector_store))
+        return tool_manager
     
     def add_course_document(self, file_path: str) -> Tuple[Course, int]:
         """
@@ -101,7 +107,29 @@ class RAGSystem:
         
         return total_courses, total_chunks
     
-    def query(self, query: str, session_id: Optional[str] = None) -> Tuple[str, List[str]]:
+    def _prepare_query(self, query: str, session_id: Optional[str]) -> Tuple[str, Optional[str]]:
+        """Build the AI prompt and fetch conversation history for a query"""
+        # Create prompt for the AI with clear instructions
+        prompt = f"""Answer this question about course materials: {query}"""
+        
+        # Get conversation history if session exists
+        history = None
+        if session_id:
+            history = self.session_manager.get_conversation_history(session_id)
+        return prompt, history
+
+    def _finish_query(self, query: str, session_id: Optional[str], response: str,
+                      tool_manager: ToolManager) -> List[str]:
+        """Collect this query's tool sources and record the exchange once a response is complete"""
+        # Sources come from the query's own tool manager, which is then discarded
+        sources = tool_manager.get_last_sources()
+        
+        # Update conversation history
+        if session_id:
+            self.session_manager.add_exchange(session_id, query, response)
+        return sources
+
+    async def query(self, query: str, session_id: Optional[str] = None) -> Tuple[str, List[str]]:
         """
         Process a user query using the RAG system with tool-based search.
         
@@ -112,34 +140,53 @@ class RAGSystem:
         Returns:
             Tuple of (response, sources list - empty for tool-based approach)
         """
-        # Create prompt for the AI with clear instructions
-        prompt = f"""Answer this question about course materials: {query}"""
-        
-        # Get conversation history if session exists
-        history = None
-        if session_id:
-            history = self.session_manager.get_conversation_history(session_id)
+        prompt, history = self._prepare_query(query, session_id)
+        tool_manager = self._new_tool_manager()
         
         # Generate response using AI with tools
-        response = self.ai_generator.generate_response(
+        response = await self.ai_generator.generate_response(
             query=prompt,
             conversation_history=history,
-            tools=self.tool_manager.get_tool_definitions(),
-            tool_manager=self.tool_manager
+            tools=tool_manager.get_tool_definitions(),
+            tool_manager=tool_manager
         )
         
-        # Get sources from the search tool
-        sources = self.tool_manager.get_last_sources()
+        # Return response with sources from tool searches
+        return response, self._finish_query(query, session_id, response, tool_manager)
 
-        # Reset sources after retrieving them
-        self.tool_manager.reset_sources()
+    async def query_stream(self, query: str, session_id: Optional[str] = None) -> AsyncIterator[Dict]:
+        """
+        Streaming variant of query().
         
-        # Update conversation history
-        if session_id:
-            self.session_manager.add_exchange(session_id, query, response)
+        Args:
+            query: User's question
+            session_id: Optional session ID for conversation context
+            
+        Yields:
+            {"type": "delta", "text": ...} events as the answer is generated,
+            {"type": "discard"} when the text streamed so far was a preamble
+            to a tool call and is not part of the answer, then a single
+            {"type": "done", "sources": [...]} event
+        """
+        prompt, history = self._prepare_query(query, session_id)
+        tool_manager = self._new_tool_manager()
         
-        # Return response with sources from tool searches
-        return response, sources
+        chunks = []
+        async for text in self.ai_generator.generate_response_stream(
+            query=prompt,
+            conversation_history=history,
+            tools=tool_manager.get_tool_definitions(),
+            tool_manager=tool_manager
+        ):
+            if text is None:
+                chunks.clear()
+                yield {"type": "discard"}
+                continue
+            chunks.append(text)
+            yield {"type": "delta", "text": text}
+        
+        sources = self._finish_query(query, session_id, "".join(chunks), tool_manager)
+        yield {"type": "done", "sources": sources}
     
     def get_course_analytics(self) -> Dict:
         """Get analytics about the course catalog"""
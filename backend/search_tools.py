@@ -1,3 +1,4 @@
+import threading
 from typing import Dict, Any, Optional, Protocol
 from abc import ABC, abstractmethod
 from vector_store import VectorStore, SearchResults
@@ -22,7 +23,9 @@ class CourseSearchTool(Tool):
     
     def __init__(self, vector_store: VectorStore):
         self.store = vector_store
-        self.last_sources = []  # Track sources from last search
+        self.last_sources = []  # Sources from every search this tool has run (one tool per query)
+        # Searches in the same round run on parallel threads
+        self._sources_lock = threading.Lock()
     
     def get_tool_definition(self) -> Dict[str, Any]:
         """Return Anthropic tool definition for this tool"""
@@ -117,8 +120,12 @@ class CourseSearchTool(Tool):
 
             formatted.append(f"{header}\n{doc}")
 
-        # Store sources for retrieval
-        self.last_sources = sources
+        # Store sources for retrieval, alongside any from earlier or parallel
+        # searches for the same query
+        with self._sources_lock:
+            for source in sources:
+                if source not in self.last_sources:
+                    self.last_sources.append(source)
 
         return "\n\n".join(formatted)
 
@@ -185,15 +192,9 @@ class ToolManager:
         return self.tools[tool_name].execute(**kwargs)
     
     def get_last_sources(self) -> list:
-        """Get sources from the last search operation"""
+        """Get the sources from every search run through this manager"""
         # Check all tools for last_sources attribute
         for tool in self.tools.values():
             if hasattr(tool, 'last_sources') and tool.last_sources:
                 return tool.last_sources
-        return []
-
-    def reset_sources(self):
-        """Reset sources from all tools that track sources"""
-        for tool in self.tools.values():
-            if hasattr(tool, 'last_sources'):
-                tool.last_sources = []
\ No newline at end of file
+        return []
\ No newline at end of file
@@ -8,22 +8,36 @@ import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
 # ---------------------------------------------------------------------------
-# Imports needed for API fixtures (must come before `import app`)
+# Imports
 # ---------------------------------------------------------------------------
-from unittest.mock import MagicMock, patch as _patch
+import re
+import warnings
+from uuid import uuid4
+from unittest.mock import AsyncMock, MagicMock, Mock
 
 import pytest
 from vector_store import SearchResults
 from models import Course, Lesson, CourseChunk
 
 
+# ---------------------------------------------------------------------------
+# Command-line options
+# ---------------------------------------------------------------------------
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--profile", action="store_true", default=False,
+        help="profile API requests with pyinstrument; one HTML report per test in prof/",
+    )
+
+
 # ---------------------------------------------------------------------------
 # SearchResults fixtures
 # ---------------------------------------------------------------------------
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def valid_search_results():
-    """A SearchResults with two documents and matching metadata."""
+    """A SearchResults with two documents and matching metadata (shared; read-only)."""
     return SearchResults(
         documents=["Lesson content about RAG systems.", "More content about embeddings."],
         metadata=[
@@ -34,23 +48,94 @@ def valid_search_results():
     )
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def empty_search_results():
-    """A SearchResults with no documents."""
+    """A SearchResults with no documents (shared; read-only)."""
     return SearchResults(documents=[], metadata=[], distances=[])
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def error_search_results():
-    """A SearchResults carrying an error message."""
+    """A SearchResults carrying an error message (shared; read-only)."""
     return SearchResults.empty("Search error: n_results must be a positive integer")
 
 
 # ---------------------------------------------------------------------------
-# Course / Lesson / CourseChunk fixtures
+# VectorStore stub
+#
+# A handwritten stand-in is far cheaper than a MagicMock(spec=VectorStore):
+# only `search` is a Mock, for call assertions; the link lookups are plain
+# methods returning plain attributes that tests set directly.
+# ---------------------------------------------------------------------------
+
+class StoreStub:
+    """Minimal VectorStore double for search tool tests."""
+
+    def __init__(self):
+        self.search = Mock()
+        self.lesson_link = None
+        self.course_link = None
+        self.course_outline = None
+
+    def get_lesson_link(self, course_title, lesson_number):
+        return self.lesson_link
+
+    def get_course_link(self, course_title):
+        return self.course_link
+
+    def get_course_outline(self, course_name):
+        return self.course_outline
+
+
+@pytest.fixture
+def store_stub():
+    """A fresh StoreStub for each test."""
+    return StoreStub()
+
+
+# ---------------------------------------------------------------------------
+# ChromaDB client for integration tests
+#
+# Creating a client is the expensive part, so one client is shared per
+# session and each test gets its own uniquely named collection, dropped
+# afterwards. By default the client is in-memory; with CHROMA_CACHE_REUSE=1
+# (handy for local loops on vector_store) it is a PersistentClient under
+# .pytest_cache/d/chroma that survives between runs until --cache-clear
+# (without the cacheprovider plugin it falls back to in-memory, with a
+# warning). chromadb is only imported when a test asks for these fixtures.
 # ---------------------------------------------------------------------------
 
+@pytest.fixture(scope="session")
+def chroma_client(request):
+    import chromadb
+    from chromadb.config import Settings
+
+    settings = Settings(anonymized_telemetry=False)
+    if os.environ.get("CHROMA_CACHE_REUSE") == "1":
+        if hasattr(request.config, "cache"):
+            path = request.config.cache.mkdir("chroma")
+            return chromadb.PersistentClient(path=str(path), settings=settings)
+        warnings.warn("CHROMA_CACHE_REUSE=1 needs pytest's cacheprovider plugin "
+                      "(disabled by -p no:cacheprovider); using an in-memory client")
+    return chromadb.EphemeralClient(settings=settings)
+
+
 @pytest.fixture
+def chroma_collection(chroma_client):
+    """An empty collection on the shared client, deleted after the test."""
+    name = f"test_{uuid4().hex}"
+    yield chroma_client.create_collection(name)
+    chroma_client.delete_collection(name)
+
+
+# ---------------------------------------------------------------------------
+# Course / Lesson / CourseChunk fixtures
+#
+# Session-scoped: tests only read these, so each is built once per run.
+# Copy before mutating in a test.
+# ---------------------------------------------------------------------------
+
+@pytest.fixture(scope="session")
 def sample_lesson():
     return Lesson(
         lesson_number=1,
@@ -60,7 +145,7 @@ def sample_lesson():
     )
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_course(sample_lesson):
     return Course(
         title="Intro to RAG",
@@ -70,7 +155,7 @@ def sample_course(sample_lesson):
     )
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_chunk():
     return CourseChunk(
         course_title="Intro to RAG",
@@ -88,56 +173,90 @@ def sample_chunk():
 #                                        and AIGenerator (Anthropic client)
 #   • app.mount("/", StaticFiles(…))  → checks that ../frontend/ exists
 #
-# Patching the four targets below before importing `app` prevents all of that
-# without changing behaviour for the other unit-test modules.
+# Patching the four targets below while importing `app` prevents all of that
+# without changing behaviour for the other unit-test modules. The import
+# happens lazily in a session fixture, so runs that never request an API
+# fixture never import `app` at all.
 # ---------------------------------------------------------------------------
 
-_vs_patcher     = _patch("rag_system.VectorStore")
-_ai_patcher     = _patch("rag_system.AIGenerator")
-_dp_patcher     = _patch("rag_system.DocumentProcessor")
-_static_patcher = _patch("fastapi.staticfiles.StaticFiles")
+@pytest.fixture(scope="session")
+def _app_module():
+    """app.py imported once with heavy deps mocked, its rag_system replaced by a shared MagicMock."""
+    with pytest.MonkeyPatch.context() as mp:
+        for target in ("rag_system.VectorStore", "rag_system.AIGenerator",
+                       "rag_system.DocumentProcessor", "fastapi.staticfiles.StaticFiles"):
+            mp.setattr(target, MagicMock())
+        import app  # safe to import now that heavy deps are mocked
+
+    # Replace the module-level RAGSystem instance with a single shared MagicMock.
+    # API test modules reset this mock before every test (see mock_rag_system below).
+    app.rag_system = MagicMock()
+    app.rag_system.query = AsyncMock()  # RAGSystem.query is a coroutine
+    return app
+
+
+@pytest.fixture(scope="module")
+def mock_rag_system(_app_module):
+    """
+    The MagicMock that stands in for app.rag_system, shared by a test module.
+    Modules using it reset it between tests (see test_api_endpoints.py).
+    """
+    return _app_module.rag_system
 
-_vs_patcher.start()
-_ai_patcher.start()
-_dp_patcher.start()
-_static_patcher.start()
 
-import app as _app_module  # safe to import now that heavy deps are mocked
+@pytest.fixture(scope="module")
+def api_client(request, _app_module):
+    """Starlette TestClient for the FastAPI app with all heavy deps mocked, built once per module."""
+    from starlette.testclient import TestClient
+    app = _app_module.app
+    if request.config.getoption("--profile"):
+        app = _RequestProfiler(app)
+    return TestClient(app)
 
-_vs_patcher.stop()
-_ai_patcher.stop()
-_dp_patcher.stop()
-_static_patcher.stop()
 
-# Replace the module-level RAGSystem instance with a single shared MagicMock.
-# Every API fixture test resets this mock before use (see mock_rag_system below).
-_shared_mock_rag = MagicMock()
-_app_module.rag_system = _shared_mock_rag
+# ---------------------------------------------------------------------------
+# Request profiling (--profile)
+#
+# TestClient runs the app on a separate event-loop thread, and pyinstrument
+# only samples the thread it was started on, so the profiler is started and
+# stopped around each request inside the app rather than around the test.
+# ---------------------------------------------------------------------------
 
+class _RequestProfiler:
+    """ASGI wrapper that records requests into the current test's Profiler, if any."""
 
-@pytest.fixture
-def mock_rag_system():
-    """
-    The MagicMock that stands in for app.rag_system.
-    Reset to a clean state with sensible defaults before every test.
-    """
-    _shared_mock_rag.reset_mock()
-    # reset_mock() does not clear side_effect; do it explicitly so a test that
-    # sets side_effect cannot bleed into the next test.
-    _shared_mock_rag.query.side_effect = None
-    _shared_mock_rag.get_course_analytics.side_effect = None
-    _shared_mock_rag.session_manager.create_session.side_effect = None
-    _shared_mock_rag.session_manager.create_session.return_value = "test-session-id"
-    _shared_mock_rag.query.return_value = ("Default answer", [])
-    _shared_mock_rag.get_course_analytics.return_value = {
-        "total_courses": 0,
-        "course_titles": [],
-    }
-    return _shared_mock_rag
+    def __init__(self, app):
+        self.app = app
+        self.profiler = None
+
+    async def __call__(self, scope, receive, send):
+        if self.profiler is None:
+            return await self.app(scope, receive, send)
+        self.profiler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.stop()
 
 
 @pytest.fixture
-def api_client(mock_rag_system):
-    """Starlette TestClient for the FastAPI app with all heavy deps mocked."""
-    from starlette.testclient import TestClient
-    return TestClient(_app_module.app)
+def profile(request, api_client):
+    """With --profile, write prof/<test id>.html for the requests this test makes."""
+    wrapper = api_client.app
+    if not isinstance(wrapper, _RequestProfiler):
+        yield
+        return
+
+    from pyinstrument import Profiler
+
+    wrapper.profiler = Profiler(async_mode="enabled")
+    try:
+        yield
+    finally:
+        profiler, wrapper.profiler = wrapper.profiler, None
+        if profiler.last_session is not None:
+            out_dir = request.config.rootpath / "prof"
+            out_dir.mkdir(exist_ok=True)
+            # nodeid, not name: test names repeat across classes
+            name = re.sub(r"[^\w.-]", "_", request.node.nodeid)
+            (out_dir / f"{name}.html").write_text(profiler.output_html())
@@ -1,14 +1,21 @@
 """
 Unit tests for AIGenerator.generate_response() in ai_generator.py.
 
-All Anthropic API calls are mocked via unittest.mock.patch so no real
-network requests are made and no API key is needed.
+All Anthropic API calls are mocked via unittest.mock.patch (with AsyncMock,
+since the client is AsyncAnthropic) so no real network requests are made
+and no API key is needed.
 """
 import pytest
-from unittest.mock import MagicMock, patch, call
+import threading
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch, call, seal
 
 from ai_generator import AIGenerator
 
+pytestmark = pytest.mark.asyncio
+
 
 # ---------------------------------------------------------------------------
 # Helpers
@@ -16,12 +23,18 @@ from ai_generator import AIGenerator
 
 FAKE_API_KEY = "sk-ant-test-key"
 FAKE_MODEL = "claude-test-model"
+FAKE_SUMMARY_MODEL = "claude-test-summary-model"
 
 
 def _make_generator():
-    return AIGenerator(api_key=FAKE_API_KEY, model=FAKE_MODEL)
+    return AIGenerator(api_key=FAKE_API_KEY, model=FAKE_MODEL, summary_model=FAKE_SUMMARY_MODEL)
+
 
+# Response mocks are only read by AIGenerator, so identical ones are built
+# once per module and shared between tests; seal() makes any accidental
+# attribute access beyond what is configured fail loudly.
 
+@lru_cache(maxsize=None)
 def _mock_end_turn_response(text="Direct answer."):
     """Build a mock Anthropic response that signals end_turn (no tool use)."""
     content_block = MagicMock()
@@ -31,6 +44,7 @@ def _mock_end_turn_response(text="Direct answer."):
     response = MagicMock()
     response.stop_reason = "end_turn"
     response.content = [content_block]
+    seal(response)
     return response
 
 
@@ -38,45 +52,95 @@ def _mock_tool_use_response(tool_name="search_course_content", tool_input=None,
     """Build a mock Anthropic response that signals tool_use."""
     if tool_input is None:
         tool_input = {"query": "RAG basics"}
+    return _cached_tool_use_response(tool_name, tuple(tool_input.items()), tool_id)
+
 
+@lru_cache(maxsize=None)
+def _cached_tool_use_response(tool_name, tool_input_items, tool_id):
     tool_block = MagicMock()
     tool_block.type = "tool_use"
     tool_block.name = tool_name
-    tool_block.input = tool_input
+    tool_block.input = dict(tool_input_items)
     tool_block.id = tool_id
 
     response = MagicMock()
     response.stop_reason = "tool_use"
     response.content = [tool_block]
+    seal(response)
     return response
 
 
+# ---------------------------------------------------------------------------
+# Shared client
+# ---------------------------------------------------------------------------
+
+class TestSharedClient:
+    async def test_instances_with_same_key_share_client(self):
+        assert _make_generator().client is _make_generator().client
+
+    async def test_different_keys_get_different_clients(self):
+        other = AIGenerator(api_key="sk-ant-other-key", model=FAKE_MODEL,
+                            summary_model=FAKE_SUMMARY_MODEL)
+        assert other.client is not _make_generator().client
+
+    async def test_request_body_is_encoded_with_orjson(self):
+        http_client = _make_generator().client._client
+        request = http_client.build_request("POST", "https://example.test", json={"a": [1, "b"]})
+        assert request.content == b'{"a":[1,"b"]}'
+
+
 # ---------------------------------------------------------------------------
 # First API call structure
 # ---------------------------------------------------------------------------
 
 class TestFirstApiCallStructure:
-    def test_first_api_call_includes_tools_and_auto_choice(self):
+    async def test_first_api_call_includes_tools_and_auto_choice(self):
         gen = _make_generator()
         tools = [{"name": "search_course_content", "description": "...", "input_schema": {}}]
         tool_manager = MagicMock()
         end_turn = _mock_end_turn_response()
 
-        with patch.object(gen.client.messages, "create", return_value=end_turn) as mock_create:
-            gen.generate_response(query="What is RAG?", tools=tools, tool_manager=tool_manager)
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, return_value=end_turn) as mock_create:
+            await gen.generate_response(query="What is RAG?", tools=tools, tool_manager=tool_manager)
 
-        first_call_kwargs = mock_create.call_args_list[0][1]
+        first_call_kwargs = mock_create.call_args_list[0].kwargs
         assert first_call_kwargs["tools"] == tools
         assert first_call_kwargs["tool_choice"] == {"type": "auto"}
 
-    def test_no_tools_param_when_tools_not_provided(self):
+    async def test_system_block_is_the_only_prefix_breakpoint(self):
+        gen = _make_generator()
+        tools = [{"name": "get_course_outline"}, {"name": "search_course_content"}]
+        end_turn = _mock_end_turn_response()
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, return_value=end_turn) as mock_create:
+            await gen.generate_response(query="What is RAG?", tools=tools, tool_manager=MagicMock())
+
+        # Prefix order is tools -> system, so the system breakpoint covers both
+        kwargs = mock_create.call_args_list[0].kwargs
+        assert all("cache_control" not in tool for tool in kwargs["tools"])
+        assert kwargs["system"][0]["cache_control"] == {"type": "ephemeral"}
+
+    async def test_no_tools_param_when_tools_not_provided(self):
+        gen = _make_generator()
+        end_turn = _mock_end_turn_response()
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, return_value=end_turn) as mock_create:
+            await gen.generate_response(query="Hello, how are you?")
+
+        first_call_kwargs = mock_create.call_args_list[0].kwargs
+        assert "tools" not in first_call_kwargs
+        assert "tool_choice" not in first_call_kwargs
+
+    async def test_tools_not_sent_without_tool_manager(self):
         gen = _make_generator()
+        tools = [{"name": "search_course_content"}]
         end_turn = _mock_end_turn_response()
 
-        with patch.object(gen.client.messages, "create", return_value=end_turn) as mock_create:
-            gen.generate_response(query="Hello, how are you?")
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, return_value=end_turn) as mock_create:
+            await gen.generate_response(query="History-only question", tools=tools)
 
-        first_call_kwargs = mock_create.call_args_list[0][1]
+        assert mock_create.call_count == 1
+        first_call_kwargs = mock_create.call_args_list[0].kwargs
         assert "tools" not in first_call_kwargs
         assert "tool_choice" not in first_call_kwargs
 
@@ -86,7 +150,7 @@ class TestFirstApiCallStructure:
 # ---------------------------------------------------------------------------
 
 class TestTwoCallPath:
-    def test_content_question_triggers_two_api_calls(self):
+    async def test_content_question_triggers_two_api_calls(self):
         gen = _make_generator()
         tools = [{"name": "search_course_content"}]
         tool_use_resp = _mock_tool_use_response()
@@ -95,12 +159,12 @@ class TestTwoCallPath:
         tool_manager = MagicMock()
         tool_manager.execute_tool.return_value = "Some search results"
 
-        with patch.object(gen.client.messages, "create", side_effect=[tool_use_resp, final_resp]) as mock_create:
-            gen.generate_response(query="What does lesson 1 cover?", tools=tools, tool_manager=tool_manager)
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, side_effect=[tool_use_resp, final_resp]) as mock_create:
+            await gen.generate_response(query="What does lesson 1 cover?", tools=tools, tool_manager=tool_manager)
 
         assert mock_create.call_count == 2
 
-    def test_tool_manager_called_with_correct_tool_name_and_args(self):
+    async def test_tool_manager_called_with_correct_tool_name_and_args(self):
         gen = _make_generator()
         tools = [{"name": "search_course_content"}]
         tool_input = {"query": "embeddings", "course_name": "Intro to RAG"}
@@ -110,14 +174,14 @@ class TestTwoCallPath:
         tool_manager = MagicMock()
         tool_manager.execute_tool.return_value = "Results"
 
-        with patch.object(gen.client.messages, "create", side_effect=[tool_use_resp, final_resp]):
-            gen.generate_response(query="Explain embeddings", tools=tools, tool_manager=tool_manager)
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, side_effect=[tool_use_resp, final_resp]):
+            await gen.generate_response(query="Explain embeddings", tools=tools, tool_manager=tool_manager)
 
         tool_manager.execute_tool.assert_called_once_with(
             "search_course_content", **tool_input
         )
 
-    def test_tool_result_sent_in_second_api_call_messages(self):
+    async def test_tool_result_sent_in_second_api_call_messages(self):
         gen = _make_generator()
         tools = [{"name": "search_course_content"}]
         tool_use_resp = _mock_tool_use_response(tool_id="toolu_XYZ")
@@ -126,10 +190,10 @@ class TestTwoCallPath:
         tool_manager = MagicMock()
         tool_manager.execute_tool.return_value = "Relevant search content"
 
-        with patch.object(gen.client.messages, "create", side_effect=[tool_use_resp, final_resp]) as mock_create:
-            gen.generate_response(query="course content question", tools=tools, tool_manager=tool_manager)
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, side_effect=[tool_use_resp, final_resp]) as mock_create:
+            await gen.generate_response(query="course content question", tools=tools, tool_manager=tool_manager)
 
-        second_call_messages = mock_create.call_args_list[1][1]["messages"]
+        second_call_messages = mock_create.call_args_list[1].kwargs["messages"]
 
         # Find the tool_result message (sent as user role)
         tool_result_msg = None
@@ -151,29 +215,29 @@ class TestTwoCallPath:
 # ---------------------------------------------------------------------------
 
 class TestSingleCallPath:
-    def test_general_question_answered_in_single_call(self):
+    async def test_general_question_answered_in_single_call(self):
         gen = _make_generator()
         tools = [{"name": "search_course_content"}]
         end_turn = _mock_end_turn_response("The capital of France is Paris.")
 
         tool_manager = MagicMock()
 
-        with patch.object(gen.client.messages, "create", return_value=end_turn) as mock_create:
-            gen.generate_response(query="What is the capital of France?", tools=tools, tool_manager=tool_manager)
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, return_value=end_turn) as mock_create:
+            await gen.generate_response(query="What is the capital of France?", tools=tools, tool_manager=tool_manager)
 
         assert mock_create.call_count == 1
         tool_manager.execute_tool.assert_not_called()
 
-    def test_response_text_extracted_from_content_block_single_call(self):
+    async def test_response_text_extracted_from_content_block_single_call(self):
         gen = _make_generator()
         end_turn = _mock_end_turn_response("Direct answer text.")
 
-        with patch.object(gen.client.messages, "create", return_value=end_turn):
-            result = gen.generate_response(query="Simple question?")
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, return_value=end_turn):
+            result = await gen.generate_response(query="Simple question?")
 
         assert result == "Direct answer text."
 
-    def test_response_text_extracted_from_content_block_two_call(self):
+    async def test_response_text_extracted_from_content_block_two_call(self):
         gen = _make_generator()
         tools = [{"name": "search_course_content"}]
         tool_use_resp = _mock_tool_use_response()
@@ -182,8 +246,8 @@ class TestSingleCallPath:
         tool_manager = MagicMock()
         tool_manager.execute_tool.return_value = "search data"
 
-        with patch.object(gen.client.messages, "create", side_effect=[tool_use_resp, final_resp]):
-            result = gen.generate_response(query="course question", tools=tools, tool_manager=tool_manager)
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, side_effect=[tool_use_resp, final_resp]):
+            result = await gen.generate_response(query="course question", tools=tools, tool_manager=tool_manager)
 
         assert result == "Final synthesized answer."
 
@@ -193,27 +257,52 @@ class TestSingleCallPath:
 # ---------------------------------------------------------------------------
 
 class TestConversationHistory:
-    def test_conversation_history_appended_to_system_prompt(self):
+    async def test_conversation_history_appended_to_system_prompt(self):
         gen = _make_generator()
         end_turn = _mock_end_turn_response()
         history = "User: Hi\nAssistant: Hello!"
 
-        with patch.object(gen.client.messages, "create", return_value=end_turn) as mock_create:
-            gen.generate_response(query="Follow-up question", conversation_history=history)
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, return_value=end_turn) as mock_create:
+            await gen.generate_response(query="Follow-up question", conversation_history=history)
 
-        system_content = mock_create.call_args_list[0][1]["system"]
-        assert history in system_content
+        system_content = mock_create.call_args_list[0].kwargs["system"]
+        assert len(system_content) == 2
+        # Static prefix block stays cacheable and unchanged
+        assert system_content[0] == AIGenerator.SYSTEM_BLOCK
+        # History rides in a second block without a cache breakpoint
+        assert history in system_content[1]["text"]
+        assert "cache_control" not in system_content[1]
 
-    def test_no_history_means_plain_system_prompt(self):
+    async def test_no_history_means_plain_system_prompt(self):
         gen = _make_generator()
         end_turn = _mock_end_turn_response()
 
-        with patch.object(gen.client.messages, "create", return_value=end_turn) as mock_create:
-            gen.generate_response(query="A question")
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, return_value=end_turn) as mock_create:
+            await gen.generate_response(query="A question")
 
-        system_content = mock_create.call_args_list[0][1]["system"]
-        # Should be exactly the static SYSTEM_PROMPT with no history appended
-        assert system_content == AIGenerator.SYSTEM_PROMPT
+        system_content = mock_create.call_args_list[0].kwargs["system"]
+        # Should be exactly the static SYSTEM_PROMPT block with no history appended
+        assert system_content == ({
+            "type": "text",
+            "text": AIGenerator.SYSTEM_PROMPT,
+            "cache_control": {"type": "ephemeral"},
+        },)
+
+    async def test_same_history_reuses_composed_system_blocks(self):
+        gen = _make_generator()
+        tools = [{"name": "search_course_content"}]
+        end_turn = _mock_end_turn_response()
+        history = "User: Hi\nAssistant: Hello!"
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, return_value=end_turn) as mock_create:
+            await gen.generate_response(query="First", conversation_history=history,
+                                        tools=tools, tool_manager=MagicMock())
+            await gen.generate_response(query="Second", conversation_history=history,
+                                        tools=tools, tool_manager=MagicMock())
+
+        first_system = mock_create.call_args_list[0].kwargs["system"]
+        second_system = mock_create.call_args_list[1].kwargs["system"]
+        assert first_system is second_system
 
 
 # ---------------------------------------------------------------------------
@@ -224,7 +313,7 @@ class TestOneRoundToolCallKeepsTools:
     """When round 0 returns tool_use and round 1 returns end_turn, the round-1
     call must still carry tools and tool_choice."""
 
-    def test_round_1_call_has_tools(self):
+    async def test_round_1_call_has_tools(self):
         gen = _make_generator()
         tools = [{"name": "search_course_content"}]
         tool_use_resp = _mock_tool_use_response()
@@ -233,16 +322,16 @@ class TestOneRoundToolCallKeepsTools:
         tool_manager = MagicMock()
         tool_manager.execute_tool.return_value = "search results"
 
-        with patch.object(gen.client.messages, "create",
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock,
                           side_effect=[tool_use_resp, end_turn_resp]) as mock_create:
-            gen.generate_response(query="course question", tools=tools, tool_manager=tool_manager)
+            await gen.generate_response(query="course question", tools=tools, tool_manager=tool_manager)
 
         assert mock_create.call_count == 2
-        round_1_kwargs = mock_create.call_args_list[1][1]
+        round_1_kwargs = mock_create.call_args_list[1].kwargs
         assert "tools" in round_1_kwargs
         assert "tool_choice" in round_1_kwargs
 
-    def test_round_1_returns_end_turn_text(self):
+    async def test_round_1_returns_end_turn_text(self):
         gen = _make_generator()
         tools = [{"name": "search_course_content"}]
         tool_use_resp = _mock_tool_use_response()
@@ -251,9 +340,9 @@ class TestOneRoundToolCallKeepsTools:
         tool_manager = MagicMock()
         tool_manager.execute_tool.return_value = "results"
 
-        with patch.object(gen.client.messages, "create",
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock,
                           side_effect=[tool_use_resp, end_turn_resp]):
-            result = gen.generate_response(query="course question", tools=tools, tool_manager=tool_manager)
+            result = await gen.generate_response(query="course question", tools=tools, tool_manager=tool_manager)
 
         assert result == "Final answer here."
 
@@ -280,60 +369,128 @@ class TestTwoRoundToolPath:
         tool_manager.execute_tool.return_value = "tool output"
         return gen, tools, [tool_use_1, tool_use_2, end_turn], tool_manager
 
-    def test_two_tool_rounds_three_api_calls(self):
+    async def test_two_tool_rounds_three_api_calls(self):
         gen, tools, side_effects, tool_manager = self._setup()
 
-        with patch.object(gen.client.messages, "create",
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock,
                           side_effect=side_effects) as mock_create:
-            gen.generate_response(query="cross-course query", tools=tools, tool_manager=tool_manager)
+            await gen.generate_response(query="cross-course query", tools=tools, tool_manager=tool_manager)
 
         assert mock_create.call_count == 3
         assert tool_manager.execute_tool.call_count == 2
 
-    def test_round_2_call_includes_tools(self):
+    async def test_round_2_call_includes_tools(self):
         gen, tools, side_effects, tool_manager = self._setup()
 
-        with patch.object(gen.client.messages, "create",
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock,
                           side_effect=side_effects) as mock_create:
-            gen.generate_response(query="cross-course query", tools=tools, tool_manager=tool_manager)
+            await gen.generate_response(query="cross-course query", tools=tools, tool_manager=tool_manager)
 
-        round_2_kwargs = mock_create.call_args_list[1][1]
+        round_2_kwargs = mock_create.call_args_list[1].kwargs
         assert "tools" in round_2_kwargs
         assert "tool_choice" in round_2_kwargs
 
-    def test_force_answer_call_has_no_tools(self):
+    async def test_force_answer_call_has_no_tools(self):
         gen, tools, side_effects, tool_manager = self._setup()
 
-        with patch.object(gen.client.messages, "create",
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock,
                           side_effect=side_effects) as mock_create:
-            gen.generate_response(query="cross-course query", tools=tools, tool_manager=tool_manager)
+            await gen.generate_response(query="cross-course query", tools=tools, tool_manager=tool_manager)
 
-        force_answer_kwargs = mock_create.call_args_list[2][1]
+        force_answer_kwargs = mock_create.call_args_list[2].kwargs
         assert "tools" not in force_answer_kwargs
         assert "tool_choice" not in force_answer_kwargs
 
-    def test_messages_accumulate_across_rounds(self):
+    async def test_cached_prefix_identical_across_rounds(self):
+        gen, tools, side_effects, tool_manager = self._setup()
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock,
+                          side_effect=side_effects) as mock_create:
+            await gen.generate_response(query="cross-course query", tools=tools, tool_manager=tool_manager)
+
+        calls = [c.kwargs for c in mock_create.call_args_list]
+        assert calls[0]["tools"] is calls[1]["tools"]
+        assert calls[0]["system"] is calls[1]["system"] is calls[2]["system"]
+
+    async def test_only_latest_tool_result_carries_cache_breakpoint(self):
         gen, tools, side_effects, tool_manager = self._setup()
 
-        with patch.object(gen.client.messages, "create",
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock,
                           side_effect=side_effects) as mock_create:
-            gen.generate_response(query="cross-course query", tools=tools, tool_manager=tool_manager)
+            await gen.generate_response(query="cross-course query", tools=tools, tool_manager=tool_manager)
+
+        messages = mock_create.call_args_list[2].kwargs["messages"]
+        round_1_results, round_2_results = messages[2]["content"], messages[4]["content"]
+        assert "cache_control" not in round_1_results[-1]
+        assert round_2_results[-1]["cache_control"] == {"type": "ephemeral"}
+
+    async def test_messages_accumulate_across_rounds(self):
+        gen, tools, side_effects, tool_manager = self._setup()
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock,
+                          side_effect=side_effects) as mock_create:
+            await gen.generate_response(query="cross-course query", tools=tools, tool_manager=tool_manager)
 
         # Force-answer call (index 2) must have 5 messages:
         # user, assistant-1, user-results-1, assistant-2, user-results-2
-        force_answer_messages = mock_create.call_args_list[2][1]["messages"]
+        force_answer_messages = mock_create.call_args_list[2].kwargs["messages"]
         assert len(force_answer_messages) == 5
 
-    def test_two_round_returns_final_text(self):
+    async def test_two_round_returns_final_text(self):
         gen, tools, side_effects, tool_manager = self._setup()
 
-        with patch.object(gen.client.messages, "create",
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock,
                           side_effect=side_effects):
-            result = gen.generate_response(query="cross-course query", tools=tools, tool_manager=tool_manager)
+            result = await gen.generate_response(query="cross-course query", tools=tools, tool_manager=tool_manager)
 
         assert result == "Synthesized final answer."
 
 
+# ---------------------------------------------------------------------------
+# tool_use stop_reason without any tool_use blocks
+# ---------------------------------------------------------------------------
+
+class TestToolUseWithoutToolBlocks:
+    """A tool_use stop_reason whose content holds no tool_use blocks ends the
+    loop with that round's text instead of another API call."""
+
+    def _text_only_tool_use_response(self, text="Answer without tools."):
+        content_block = MagicMock()
+        content_block.type = "text"
+        content_block.text = text
+
+        response = MagicMock()
+        response.stop_reason = "tool_use"
+        response.content = [content_block]
+        return response
+
+    async def test_single_api_call(self):
+        gen = _make_generator()
+        tools = [{"name": "search_course_content"}]
+        tool_manager = MagicMock()
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock,
+                          return_value=self._text_only_tool_use_response()) as mock_create:
+            result = await gen.generate_response(query="question", tools=tools, tool_manager=tool_manager)
+
+        assert mock_create.call_count == 1
+        tool_manager.execute_tool.assert_not_called()
+        assert result == "Answer without tools."
+
+    async def test_no_text_block_returns_empty_string(self):
+        gen = _make_generator()
+        tools = [{"name": "search_course_content"}]
+        response = MagicMock()
+        response.stop_reason = "tool_use"
+        response.content = []
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock,
+                          return_value=response):
+            result = await gen.generate_response(query="question", tools=tools, tool_manager=MagicMock())
+
+        assert result == ""
+
+
 # ---------------------------------------------------------------------------
 # Tool error handling
 # ---------------------------------------------------------------------------
@@ -342,7 +499,7 @@ class TestToolErrorHandling:
     """Tool execution errors are caught and fed back as strings; they must
     never propagate to the caller."""
 
-    def test_tool_error_does_not_raise(self):
+    async def test_tool_error_does_not_raise(self):
         gen = _make_generator()
         tools = [{"name": "search_course_content"}]
         tool_use_resp = _mock_tool_use_response()
@@ -351,14 +508,14 @@ class TestToolErrorHandling:
         tool_manager = MagicMock()
         tool_manager.execute_tool.side_effect = ValueError("db down")
 
-        with patch.object(gen.client.messages, "create",
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock,
                           side_effect=[tool_use_resp, end_turn_resp]):
             # Must not raise
-            result = gen.generate_response(query="question", tools=tools, tool_manager=tool_manager)
+            result = await gen.generate_response(query="question", tools=tools, tool_manager=tool_manager)
 
         assert isinstance(result, str)
 
-    def test_tool_error_string_in_messages(self):
+    async def test_tool_error_string_in_messages(self):
         gen = _make_generator()
         tools = [{"name": "search_course_content"}]
         tool_use_resp = _mock_tool_use_response(tool_id="toolu_err")
@@ -367,11 +524,11 @@ class TestToolErrorHandling:
         tool_manager = MagicMock()
         tool_manager.execute_tool.side_effect = ValueError("db down")
 
-        with patch.object(gen.client.messages, "create",
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock,
                           side_effect=[tool_use_resp, end_turn_resp]) as mock_create:
-            gen.generate_response(query="question", tools=tools, tool_manager=tool_manager)
+            await gen.generate_response(query="question", tools=tools, tool_manager=tool_manager)
 
-        second_call_messages = mock_create.call_args_list[1][1]["messages"]
+        second_call_messages = mock_create.call_args_list[1].kwargs["messages"]
         tool_result_content = None
         for msg in second_call_messages:
             if msg["role"] == "user" and isinstance(msg["content"], list):
@@ -383,7 +540,7 @@ class TestToolErrorHandling:
         assert tool_result_content is not None
         assert "Tool execution error" in tool_result_content
 
-    def test_tool_error_round_1_still_two_calls(self):
+    async def test_tool_error_round_1_still_two_calls(self):
         gen = _make_generator()
         tools = [{"name": "search_course_content"}]
         tool_use_resp = _mock_tool_use_response()
@@ -392,13 +549,13 @@ class TestToolErrorHandling:
         tool_manager = MagicMock()
         tool_manager.execute_tool.side_effect = ValueError("db down")
 
-        with patch.object(gen.client.messages, "create",
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock,
                           side_effect=[tool_use_resp, end_turn_resp]) as mock_create:
-            gen.generate_response(query="question", tools=tools, tool_manager=tool_manager)
+            await gen.generate_response(query="question", tools=tools, tool_manager=tool_manager)
 
         assert mock_create.call_count == 2
 
-    def test_tool_error_round_2(self):
+    async def test_tool_error_round_2(self):
         gen = _make_generator()
         tools = [{"name": "search_course_content"}]
         tool_use_1 = _mock_tool_use_response(tool_name="get_course_outline",
@@ -411,9 +568,446 @@ class TestToolErrorHandling:
         # First call succeeds, second raises
         tool_manager.execute_tool.side_effect = ["outline results", ValueError("index error")]
 
-        with patch.object(gen.client.messages, "create",
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock,
                           side_effect=[tool_use_1, tool_use_2, end_turn]) as mock_create:
-            result = gen.generate_response(query="cross query", tools=tools, tool_manager=tool_manager)
+            result = await gen.generate_response(query="cross query", tools=tools, tool_manager=tool_manager)
 
         assert mock_create.call_count == 3
         assert isinstance(result, str)
+
+
+# ---------------------------------------------------------------------------
+# Exact-match response cache
+# ---------------------------------------------------------------------------
+
+class TestResponseCache:
+    """Tool-free calls with identical inputs are answered from the in-process
+    cache; anything that involves a tool_manager always hits the API."""
+
+    async def test_repeated_tool_free_query_makes_one_api_call(self):
+        gen = _make_generator()
+        end_turn = _mock_end_turn_response("RAG is retrieval-augmented generation.")
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, return_value=end_turn) as mock_create:
+            first = await gen.generate_response(query="What is RAG?")
+            second = await gen.generate_response(query="What is RAG?")
+
+        assert mock_create.call_count == 1
+        assert first == second == "RAG is retrieval-augmented generation."
+
+    async def test_different_history_is_a_cache_miss(self):
+        gen = _make_generator()
+        end_turn = _mock_end_turn_response()
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, return_value=end_turn) as mock_create:
+            await gen.generate_response(query="What is RAG?")
+            await gen.generate_response(query="What is RAG?", conversation_history="User: Hi")
+
+        assert mock_create.call_count == 2
+
+    async def test_calls_with_tool_manager_are_not_cached(self):
+        gen = _make_generator()
+        tools = [{"name": "search_course_content"}]
+        end_turn = _mock_end_turn_response()
+        tool_manager = MagicMock()
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, return_value=end_turn) as mock_create:
+            await gen.generate_response(query="What is RAG?", tools=tools, tool_manager=tool_manager)
+            await gen.generate_response(query="What is RAG?", tools=tools, tool_manager=tool_manager)
+
+        assert mock_create.call_count == 2
+
+    async def test_least_recently_used_entry_is_evicted(self):
+        gen = _make_generator()
+        gen.RESPONSE_CACHE_SIZE = 2
+        end_turn = _mock_end_turn_response()
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, return_value=end_turn) as mock_create:
+            await gen.generate_response(query="q1")
+            await gen.generate_response(query="q2")
+            await gen.generate_response(query="q1")  # refreshes q1
+            await gen.generate_response(query="q3")  # evicts q2
+            await gen.generate_response(query="q1")
+            await gen.generate_response(query="q2")
+
+        assert mock_create.call_count == 4
+
+
+# ---------------------------------------------------------------------------
+# Multiple tool_use blocks in a single round
+# ---------------------------------------------------------------------------
+
+class TestParallelToolCalls:
+    """Several tool_use blocks in one response are all executed and their
+    results are sent back in the same order as the tool_use blocks."""
+
+    def _two_tool_response(self):
+        outline = _mock_tool_use_response(tool_name="get_course_outline",
+                                          tool_input={"course_title": "RAG"},
+                                          tool_id="toolu_A").content[0]
+        search = _mock_tool_use_response(tool_name="search_course_content",
+                                         tool_input={"query": "embeddings"},
+                                         tool_id="toolu_B").content[0]
+        response = MagicMock()
+        response.stop_reason = "tool_use"
+        response.content = [outline, search]
+        return response
+
+    async def test_all_tools_executed(self):
+        gen = _make_generator()
+        tools = [{"name": "get_course_outline"}, {"name": "search_course_content"}]
+        tool_manager = MagicMock()
+        tool_manager.execute_tool.side_effect = lambda name, **kwargs: f"{name} output"
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock,
+                          side_effect=[self._two_tool_response(), _mock_end_turn_response()]):
+            await gen.generate_response(query="outline and search", tools=tools, tool_manager=tool_manager)
+
+        assert tool_manager.execute_tool.call_count == 2
+        tool_manager.execute_tool.assert_any_call("get_course_outline", course_title="RAG")
+        tool_manager.execute_tool.assert_any_call("search_course_content", query="embeddings")
+
+    async def test_results_keep_tool_use_order(self):
+        gen = _make_generator()
+        tools = [{"name": "get_course_outline"}, {"name": "search_course_content"}]
+        tool_manager = MagicMock()
+        tool_manager.execute_tool.side_effect = lambda name, **kwargs: f"{name} output"
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock,
+                          side_effect=[self._two_tool_response(), _mock_end_turn_response()]) as mock_create:
+            await gen.generate_response(query="outline and search", tools=tools, tool_manager=tool_manager)
+
+        tool_results = mock_create.call_args_list[1].kwargs["messages"][-1]["content"]
+        assert [r["tool_use_id"] for r in tool_results] == ["toolu_A", "toolu_B"]
+        assert [r["content"] for r in tool_results] == [
+            "get_course_outline output", "search_course_content output"
+        ]
+
+    async def test_one_failing_tool_does_not_affect_the_other(self):
+        gen = _make_generator()
+        tools = [{"name": "get_course_outline"}, {"name": "search_course_content"}]
+        tool_manager = MagicMock()
+
+        def execute(name, **kwargs):
+            if name == "get_course_outline":
+                raise ValueError("db down")
+            return "search output"
+        tool_manager.execute_tool.side_effect = execute
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock,
+                          side_effect=[self._two_tool_response(), _mock_end_turn_response()]) as mock_create:
+            await gen.generate_response(query="outline and search", tools=tools, tool_manager=tool_manager)
+
+        tool_results = mock_create.call_args_list[1].kwargs["messages"][-1]["content"]
+        assert "Tool execution error" in tool_results[0]["content"]
+        assert tool_results[1]["content"] == "search output"
+
+    async def test_single_tool_runs_off_the_event_loop(self):
+        gen = _make_generator()
+        tool_manager = MagicMock()
+        threads = []
+        tool_manager.execute_tool.side_effect = lambda name, **kwargs: threads.append(threading.get_ident()) or "out"
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock,
+                          side_effect=[_mock_tool_use_response(), _mock_end_turn_response()]):
+            await gen.generate_response(query="q", tools=[{"name": "search_course_content"}],
+                                        tool_manager=tool_manager)
+
+        assert threads and threads[0] != threading.get_ident()
+
+
+# ---------------------------------------------------------------------------
+# Streaming (generate_response_stream)
+# ---------------------------------------------------------------------------
+
+class _FakeStream:
+    """Stands in for the AsyncMessageStreamManager returned by messages.stream."""
+
+    def __init__(self, chunks, final=None):
+        self.chunks = chunks
+        self.final = final if final is not None else _mock_end_turn_response("".join(chunks))
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    @property
+    async def text_stream(self):
+        for chunk in self.chunks:
+            yield chunk
+
+    async def get_final_message(self):
+        return self.final
+
+
+async def _collect(agen):
+    return [chunk async for chunk in agen]
+
+
+class TestStreaming:
+    async def test_tool_free_call_is_streamed(self):
+        gen = _make_generator()
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock) as mock_create, \
+             patch.object(gen.client.messages, "stream",
+                          return_value=_FakeStream(["Hello", ", ", "world"])) as mock_stream:
+            chunks = await _collect(gen.generate_response_stream(query="Hi"))
+
+        assert chunks == ["Hello", ", ", "world"]
+        mock_create.assert_not_called()
+        stream_kwargs = mock_stream.call_args.kwargs
+        assert "tools" not in stream_kwargs
+        assert stream_kwargs["system"][0] == AIGenerator.SYSTEM_BLOCK
+
+    async def test_streamed_answer_is_cached(self):
+        gen = _make_generator()
+
+        with patch.object(gen.client.messages, "stream",
+                          return_value=_FakeStream(["Cached ", "answer"])) as mock_stream:
+            await _collect(gen.generate_response_stream(query="What is RAG?"))
+            second = await _collect(gen.generate_response_stream(query="What is RAG?"))
+
+        assert mock_stream.call_count == 1
+        assert second == ["Cached answer"]
+
+    async def test_end_turn_tool_round_is_streamed(self):
+        gen = _make_generator()
+        tools = [{"name": "search_course_content"}]
+        tool_manager = MagicMock()
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock) as mock_create, \
+             patch.object(gen.client.messages, "stream",
+                          return_value=_FakeStream(["Direct ", "answer."])) as mock_stream:
+            chunks = await _collect(gen.generate_response_stream(
+                query="General question", tools=tools, tool_manager=tool_manager))
+
+        assert chunks == ["Direct ", "answer."]
+        mock_create.assert_not_called()
+        assert mock_stream.call_args.kwargs["tools"] == tools
+        tool_manager.execute_tool.assert_not_called()
+
+    async def test_tool_round_runs_tools_then_streams_answer(self):
+        gen = _make_generator()
+        tools = [{"name": "search_course_content"}]
+        tool_manager = MagicMock()
+        tool_manager.execute_tool.return_value = "tool output"
+        streams = [_FakeStream(["Let me check. "], final=_mock_tool_use_response()),
+                   _FakeStream(["Found ", "it."])]
+
+        with patch.object(gen.client.messages, "stream", side_effect=streams) as mock_stream:
+            chunks = await _collect(gen.generate_response_stream(
+                query="What is RAG?", tools=tools, tool_manager=tool_manager))
+
+        # The preamble before the tool call is retracted, not part of the answer
+        assert chunks == ["Let me check. ", None, "Found ", "it."]
+        tool_manager.execute_tool.assert_called_once_with("search_course_content", query="RAG basics")
+        second_messages = mock_stream.call_args_list[1].kwargs["messages"]
+        assert second_messages[-1]["content"][0]["content"] == "tool output"
+
+    async def test_force_answer_after_max_rounds_is_streamed_without_tools(self):
+        gen = _make_generator()
+        tools = [{"name": "search_course_content"}]
+        tool_manager = MagicMock()
+        tool_manager.execute_tool.return_value = "tool output"
+        streams = [_FakeStream([], final=_mock_tool_use_response(tool_id="toolu_001")),
+                   _FakeStream([], final=_mock_tool_use_response(tool_id="toolu_002")),
+                   _FakeStream(["Synth", "esized"])]
+
+        with patch.object(gen.client.messages, "stream", side_effect=streams) as mock_stream:
+            chunks = await _collect(gen.generate_response_stream(
+                query="cross-course query", tools=tools, tool_manager=tool_manager))
+
+        assert chunks == ["Synth", "esized"]
+        assert mock_stream.call_count == 3
+        stream_kwargs = mock_stream.call_args.kwargs
+        assert "tools" not in stream_kwargs
+        assert "tool_choice" not in stream_kwargs
+        assert len(stream_kwargs["messages"]) == 5
+
+
+# ---------------------------------------------------------------------------
+# Message Batches (generate_batch)
+# ---------------------------------------------------------------------------
+
+def _batch(status, batch_id="msgbatch_001"):
+    batch = MagicMock()
+    batch.id = batch_id
+    batch.processing_status = status
+    return batch
+
+
+def _batch_entry(custom_id, text=None):
+    """One results() line: succeeded with `text`, or errored when text is None."""
+    entry = MagicMock()
+    entry.custom_id = custom_id
+    if text is None:
+        entry.result.type = "errored"
+    else:
+        entry.result.type = "succeeded"
+        entry.result.message = _mock_end_turn_response(text)
+    return entry
+
+
+def _results_decoder(*entries):
+    async def decoder():
+        for entry in entries:
+            yield entry
+    return decoder()
+
+
+class TestGenerateBatch:
+    @contextmanager
+    def _patch_batches(self, gen, create, retrieve, results):
+        batches = gen.client.messages.batches
+        with ExitStack() as stack:
+            yield SimpleNamespace(
+                create=stack.enter_context(patch.object(
+                    batches, "create", new_callable=AsyncMock, return_value=create)),
+                retrieve=stack.enter_context(patch.object(
+                    batches, "retrieve", new_callable=AsyncMock, side_effect=retrieve)),
+                results=stack.enter_context(patch.object(
+                    batches, "results", new_callable=AsyncMock, return_value=results)),
+                sleep=stack.enter_context(patch.object(
+                    AIGenerator, "_sleep", new_callable=AsyncMock)),
+            )
+
+    async def test_one_request_per_query_without_tools(self):
+        gen = _make_generator()
+        with self._patch_batches(gen, _batch("ended"), [],
+                                 _results_decoder(_batch_entry("query-0", "a"))) as mocks:
+            await gen.generate_batch(["What is RAG?", "What is MCP?"])
+
+        requests = mocks.create.call_args.kwargs["requests"]
+        assert [r["custom_id"] for r in requests] == ["query-0", "query-1"]
+        params = requests[1]["params"]
+        assert params["messages"] == [{"role": "user", "content": "What is MCP?"}]
+        assert params["system"][0] == AIGenerator.SYSTEM_BLOCK
+        # No tool loop runs for batches, so a tool_use stop would lose the answer
+        assert "tools" not in params
+        assert "tool_choice" not in params
+
+    async def test_polls_with_backoff_until_ended(self):
+        gen = _make_generator()
+        with self._patch_batches(
+            gen, _batch("in_progress"),
+            [_batch("in_progress"), _batch("in_progress"), _batch("ended")],
+            _results_decoder(_batch_entry("query-0", "done")),
+        ) as mocks:
+            await gen.generate_batch(["q"])
+
+        assert mocks.retrieve.call_count == 3
+        delays = [c.args[0] for c in mocks.sleep.call_args_list]
+        assert delays == [1.0, 2.0, 4.0]
+
+    async def test_results_returned_in_query_order(self):
+        gen = _make_generator()
+        # Results are not guaranteed to come back in request order
+        with self._patch_batches(gen, _batch("ended"), [], _results_decoder(
+            _batch_entry("query-1", "second"),
+            _batch_entry("query-0", "first"),
+            _batch_entry("query-2"),
+        )):
+            answers = await gen.generate_batch(["a", "b", "c"])
+
+        assert answers == ["first", "second", ""]
+
+
+# ---------------------------------------------------------------------------
+# Over-budget conversation history
+# ---------------------------------------------------------------------------
+
+class TestHistorySummarization:
+    """History longer than MAX_HISTORY_TOKENS (approximated as len // 4) is
+    condensed: earlier exchanges become a summary, the latest stays verbatim."""
+
+    def _long_history(self):
+        earlier = "User: Tell me everything\nAssistant: " + "word " * 2000
+        latest = "User: And lesson 2?\nAssistant: Lesson 2 covers embeddings."
+        return earlier, latest, f"{earlier}\n{latest}"
+
+    async def test_short_history_sent_unchanged(self):
+        gen = _make_generator()
+        history = "User: Hi\nAssistant: Hello!"
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock,
+                          return_value=_mock_end_turn_response()) as mock_create:
+            await gen.generate_response(query="Follow-up", conversation_history=history)
+
+        assert mock_create.call_count == 1
+        assert history in mock_create.call_args.kwargs["system"][1]["text"]
+
+    async def test_long_history_summarized_with_summary_model(self):
+        gen = _make_generator()
+        earlier, latest, history = self._long_history()
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, side_effect=[
+            _mock_end_turn_response("User asked for everything."),
+            _mock_end_turn_response("Answer."),
+        ]) as mock_create:
+            await gen.generate_response(query="Follow-up", conversation_history=history)
+
+        summary_kwargs, answer_kwargs = [c.kwargs for c in mock_create.call_args_list]
+        assert summary_kwargs["model"] == FAKE_SUMMARY_MODEL
+        assert summary_kwargs["max_tokens"] == AIGenerator.SUMMARY_MAX_TOKENS
+        assert earlier in summary_kwargs["messages"][0]["content"]
+
+        sent_history = answer_kwargs["system"][1]["text"]
+        assert "User asked for everything." in sent_history
+        assert latest in sent_history
+        assert "word word" not in sent_history
+
+    async def test_summary_reused_for_same_earlier_history(self):
+        gen = _make_generator()
+        tools = [{"name": "search_course_content"}]
+        _, _, history = self._long_history()
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, side_effect=[
+            _mock_end_turn_response("Summary."),
+            _mock_end_turn_response("First answer."),
+            _mock_end_turn_response("Second answer."),
+        ]) as mock_create:
+            await gen.generate_response(query="One", conversation_history=history,
+                                        tools=tools, tool_manager=MagicMock())
+            await gen.generate_response(query="Two", conversation_history=history,
+                                        tools=tools, tool_manager=MagicMock())
+
+        assert mock_create.call_count == 3
+
+    async def test_next_turn_only_summarizes_the_exchange_that_aged_out(self):
+        gen = _make_generator()
+        earlier, latest, history = self._long_history()
+        newest = "User: And lesson 3?\nAssistant: Lesson 3 covers retrieval."
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, side_effect=[
+            _mock_end_turn_response("Everything summary."),
+            _mock_end_turn_response("First answer."),
+            _mock_end_turn_response("Lesson 2 summary."),
+            _mock_end_turn_response("Second answer."),
+        ]) as mock_create:
+            await gen.generate_response(query="One", conversation_history=history)
+            await gen.generate_response(query="Two", conversation_history=f"{history}\n{newest}")
+
+        assert mock_create.call_count == 4
+        assert latest in mock_create.call_args_list[2].kwargs["messages"][0]["content"]
+        assert earlier not in mock_create.call_args_list[2].kwargs["messages"][0]["content"]
+        sent_history = mock_create.call_args.kwargs["system"][1]["text"]
+        assert "Everything summary. Lesson 2 summary." in sent_history
+        assert newest in sent_history
+
+    async def test_failed_summary_falls_back_to_latest_exchange(self):
+        gen = _make_generator()
+        _, latest, history = self._long_history()
+
+        with patch.object(gen.client.messages, "create", new_callable=AsyncMock, side_effect=[
+            RuntimeError("overloaded"),
+            _mock_end_turn_response("Answer."),
+        ]) as mock_create:
+            result = await gen.generate_response(query="Follow-up", conversation_history=history)
+
+        assert result == "Answer."
+        sent_history = mock_create.call_args.kwargs["system"][1]["text"]
+        assert latest in sent_history
+        assert "word word" not in sent_history
+        assert "Summary of earlier conversation" not in sent_history
@@ -6,9 +6,49 @@ app.py is imported with all heavy dependencies mocked (see conftest.py):
   • StaticFiles mount (../frontend does not exist in the test environment)
 
 Tests use the `api_client` and `mock_rag_system` fixtures from conftest.py.
+Both are module-scoped; `_reset_mock_rag` below restores the mock's defaults
+before every test. Run with `--profile` to get a pyinstrument report per test.
 """
+import json
+
+import orjson
 import pytest
 
+pytestmark = pytest.mark.usefixtures("profile")
+
+
+# Request bodies are encoded once per run and posted as raw content, instead of
+# being re-serialized by TestClient on every call
+_JSON_HEADERS = {"content-type": "application/json"}
+_JSON_BODIES = {name: orjson.dumps(body) for name, body in {
+    "what_is_rag": {"query": "What is RAG?"},
+    "hello": {"query": "Hello?"},
+    "follow_up": {"query": "Follow-up?", "session_id": "existing-session-xyz"},
+    "course_question": {"query": "Course question?"},
+    "vector_search": {"query": "How does vector search work?"},
+    "with_session": {"query": "Question?", "session_id": "my-session"},
+    "any_question": {"query": "Any question"},
+    "cross_course": {"query": "Cross-course question?"},
+    "follow_up_my_session": {"query": "Follow-up?", "session_id": "my-session"},
+}.items()}
+
+
+def _post_json(api_client, url, body):
+    """POST the precomputed JSON body named `body` to url."""
+    return api_client.post(url, content=_JSON_BODIES[body], headers=_JSON_HEADERS)
+
+
+@pytest.fixture(autouse=True)
+def _reset_mock_rag(mock_rag_system):
+    """Clear calls, return values and side effects, then apply sensible defaults."""
+    mock_rag_system.reset_mock(return_value=True, side_effect=True)
+    mock_rag_system.session_manager.create_session.return_value = "test-session-id"
+    mock_rag_system.query.return_value = ("Default answer", [])
+    mock_rag_system.get_course_analytics.return_value = {
+        "total_courses": 0,
+        "course_titles": [],
+    }
+
 
 # ---------------------------------------------------------------------------
 # POST /api/query
@@ -17,113 +57,127 @@ import pytest
 class TestQueryEndpoint:
     """Tests for POST /api/query."""
 
-    def test_returns_200_with_valid_query(self, api_client, mock_rag_system):
-        mock_rag_system.query.return_value = ("Some answer.", [])
+    @pytest.mark.parametrize("body, answer, sources", [
+        ("what_is_rag", "RAG stands for Retrieval-Augmented Generation.", []),
+        ("course_question", "Answer with source.", [
+            {"title": "RAG Course", "lesson_number": 1, "url": "https://example.com/lesson1"},
+        ]),
+        ("cross_course", "Multi-source answer.", [
+            {"title": "Course A", "lesson_number": 1, "url": None},
+            {"title": "Course B", "lesson_number": 2, "url": "https://example.com"},
+        ]),
+    ], ids=["no_sources", "one_source", "multiple_sources"])
+    def test_returns_answer_and_sources(self, api_client, mock_rag_system, body, answer, sources):
+        mock_rag_system.query.return_value = (answer, sources)
 
-        response = api_client.post("/api/query", json={"query": "What is RAG?"})
+        response = _post_json(api_client, "/api/query", body)
+        data = response.json()
 
         assert response.status_code == 200
-
-    def test_response_body_contains_answer(self, api_client, mock_rag_system):
-        mock_rag_system.query.return_value = ("RAG stands for Retrieval-Augmented Generation.", [])
-
-        response = api_client.post("/api/query", json={"query": "What is RAG?"})
-
-        assert response.json()["answer"] == "RAG stands for Retrieval-Augmented Generation."
-
-    def test_new_session_id_created_when_none_provided(self, api_client, mock_rag_system):
+        assert data["answer"] == answer
+        assert data["sources"] == sources
+
+    @pytest.mark.parametrize("body, expected_session_id, create_session_calls", [
+        ("hello", "new-session-abc", 1),
+        ("follow_up", "existing-session-xyz", 0),
+    ], ids=["new_session", "existing_session"])
+    def test_session_id_in_response(self, api_client, mock_rag_system,
+                                    body, expected_session_id, create_session_calls):
         mock_rag_system.session_manager.create_session.return_value = "new-session-abc"
-        mock_rag_system.query.return_value = ("Answer", [])
-
-        response = api_client.post("/api/query", json={"query": "Hello?"})
 
-        assert response.json()["session_id"] == "new-session-abc"
+        response = _post_json(api_client, "/api/query", body)
 
-    def test_existing_session_id_passed_through(self, api_client, mock_rag_system):
-        mock_rag_system.query.return_value = ("Answer", [])
+        assert response.json()["session_id"] == expected_session_id
+        assert mock_rag_system.session_manager.create_session.call_count == create_session_calls
 
-        response = api_client.post(
-            "/api/query",
-            json={"query": "Follow-up?", "session_id": "existing-session-xyz"},
-        )
-
-        assert response.json()["session_id"] == "existing-session-xyz"
+    @pytest.mark.parametrize("body, query, session_id", [
+        ("vector_search", "How does vector search work?", "test-session-id"),
+        ("with_session", "Question?", "my-session"),
+    ], ids=["created_session", "given_session"])
+    def test_query_and_session_forwarded_to_rag_system(self, api_client, mock_rag_system,
+                                                       body, query, session_id):
+        _post_json(api_client, "/api/query", body)
 
-    def test_create_session_not_called_when_session_id_provided(self, api_client, mock_rag_system):
-        mock_rag_system.query.return_value = ("Answer", [])
+        mock_rag_system.query.assert_called_once_with(query, session_id)
 
-        api_client.post(
-            "/api/query",
-            json={"query": "Follow-up?", "session_id": "existing-session-xyz"},
-        )
+    def test_returns_500_when_rag_system_raises(self, api_client, mock_rag_system):
+        mock_rag_system.query.side_effect = RuntimeError("DB connection failed")
 
-        mock_rag_system.session_manager.create_session.assert_not_called()
+        response = _post_json(api_client, "/api/query", "any_question")
 
-    def test_sources_returned_in_response(self, api_client, mock_rag_system):
-        sources = [{"title": "RAG Course", "lesson_number": 1, "url": "https://example.com/lesson1"}]
-        mock_rag_system.query.return_value = ("Answer with source.", sources)
+        assert response.status_code == 500
 
-        response = api_client.post("/api/query", json={"query": "Course question?"})
-        data = response.json()
+    def test_500_response_includes_error_detail(self, api_client, mock_rag_system):
+        mock_rag_system.query.side_effect = RuntimeError("DB connection failed")
 
-        assert len(data["sources"]) == 1
-        assert data["sources"][0]["title"] == "RAG Course"
-        assert data["sources"][0]["lesson_number"] == 1
-        assert data["sources"][0]["url"] == "https://example.com/lesson1"
+        response = _post_json(api_client, "/api/query", "any_question")
 
-    def test_empty_sources_list_when_no_search_performed(self, api_client, mock_rag_system):
-        mock_rag_system.query.return_value = ("General answer.", [])
+        assert "DB connection failed" in response.json()["detail"]
 
-        response = api_client.post("/api/query", json={"query": "What is 2 + 2?"})
 
-        assert response.json()["sources"] == []
+# ---------------------------------------------------------------------------
+# POST /api/query/stream
+# ---------------------------------------------------------------------------
 
-    def test_query_text_forwarded_to_rag_system(self, api_client, mock_rag_system):
-        mock_rag_system.query.return_value = ("Answer", [])
+def _events(*events):
+    """side_effect for query_stream: an async generator yielding the given events."""
+    async def query_stream(query, session_id):
+        for event in events:
+            if isinstance(event, Exception):
+                raise event
+            yield event
+    return query_stream
 
-        api_client.post("/api/query", json={"query": "How does vector search work?"})
 
-        positional_args = mock_rag_system.query.call_args[0]
-        assert "How does vector search work?" in positional_args[0]
+class TestQueryStreamEndpoint:
+    """Tests for POST /api/query/stream (newline-delimited JSON events)."""
 
-    def test_session_id_forwarded_to_rag_system(self, api_client, mock_rag_system):
-        mock_rag_system.query.return_value = ("Answer", [])
+    def _post(self, api_client, body):
+        response = _post_json(api_client, "/api/query/stream", body)
+        return response, [json.loads(line) for line in response.text.splitlines()]
 
-        api_client.post(
-            "/api/query",
-            json={"query": "Question?", "session_id": "my-session"},
+    def test_streams_deltas_then_done(self, api_client, mock_rag_system):
+        mock_rag_system.query_stream.side_effect = _events(
+            {"type": "delta", "text": "RAG is "},
+            {"type": "delta", "text": "retrieval."},
+            {"type": "done", "sources": []},
         )
 
-        _, forwarded_session = mock_rag_system.query.call_args[0]
-        assert forwarded_session == "my-session"
+        response, events = self._post(api_client, "what_is_rag")
 
-    def test_returns_500_when_rag_system_raises(self, api_client, mock_rag_system):
-        mock_rag_system.query.side_effect = RuntimeError("DB connection failed")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        assert [e["type"] for e in events] == ["delta", "delta", "done"]
+        assert "".join(e["text"] for e in events[:-1]) == "RAG is retrieval."
 
-        response = api_client.post("/api/query", json={"query": "Any question"})
+    def test_done_event_carries_sources_and_session_id(self, api_client, mock_rag_system):
+        sources = [{"title": "RAG Course", "lesson_number": 1, "url": None}]
+        mock_rag_system.session_manager.create_session.return_value = "new-session-abc"
+        mock_rag_system.query_stream.side_effect = _events({"type": "done", "sources": sources})
 
-        assert response.status_code == 500
+        _, events = self._post(api_client, "course_question")
 
-    def test_500_response_includes_error_detail(self, api_client, mock_rag_system):
-        mock_rag_system.query.side_effect = RuntimeError("DB connection failed")
+        assert events[-1] == {"type": "done", "sources": sources, "session_id": "new-session-abc"}
 
-        response = api_client.post("/api/query", json={"query": "Any question"})
+    def test_existing_session_id_forwarded(self, api_client, mock_rag_system):
+        mock_rag_system.query_stream.side_effect = _events({"type": "done", "sources": []})
 
-        assert "DB connection failed" in response.json()["detail"]
+        _, events = self._post(api_client, "follow_up_my_session")
 
-    def test_multiple_sources_all_present_in_response(self, api_client, mock_rag_system):
-        sources = [
-            {"title": "Course A", "lesson_number": 1, "url": None},
-            {"title": "Course B", "lesson_number": 2, "url": "https://example.com"},
-        ]
-        mock_rag_system.query.return_value = ("Multi-source answer.", sources)
+        mock_rag_system.session_manager.create_session.assert_not_called()
+        mock_rag_system.query_stream.assert_called_once_with("Follow-up?", "my-session")
+        assert events[-1]["session_id"] == "my-session"
 
-        response = api_client.post("/api/query", json={"query": "Cross-course question?"})
-        data = response.json()
+    def test_error_reported_as_final_event(self, api_client, mock_rag_system):
+        mock_rag_system.query_stream.side_effect = _events(
+            {"type": "delta", "text": "Partial"},
+            RuntimeError("DB connection failed"),
+        )
 
-        assert len(data["sources"]) == 2
-        assert data["sources"][0]["title"] == "Course A"
-        assert data["sources"][1]["title"] == "Course B"
+        response, events = self._post(api_client, "any_question")
+
+        assert response.status_code == 200
+        assert events[-1] == {"type": "error", "detail": "DB connection failed"}
 
 
 # ---------------------------------------------------------------------------
@@ -133,47 +187,24 @@ class TestQueryEndpoint:
 class TestCoursesEndpoint:
     """Tests for GET /api/courses."""
 
-    def test_returns_200(self, api_client, mock_rag_system):
-        mock_rag_system.get_course_analytics.return_value = {
-            "total_courses": 1,
-            "course_titles": ["Intro to RAG"],
-        }
-
-        response = api_client.get("/api/courses")
-
-        assert response.status_code == 200
-
-    def test_total_courses_count_in_response(self, api_client, mock_rag_system):
-        mock_rag_system.get_course_analytics.return_value = {
-            "total_courses": 3,
-            "course_titles": ["Course A", "Course B", "Course C"],
-        }
-
-        response = api_client.get("/api/courses")
-
-        assert response.json()["total_courses"] == 3
-
-    def test_course_titles_list_in_response(self, api_client, mock_rag_system):
-        mock_rag_system.get_course_analytics.return_value = {
-            "total_courses": 2,
-            "course_titles": ["Intro to RAG", "MCP Course"],
-        }
-
-        response = api_client.get("/api/courses")
-
-        assert response.json()["course_titles"] == ["Intro to RAG", "MCP Course"]
-
-    def test_empty_catalog_returns_zero_and_empty_list(self, api_client, mock_rag_system):
+    @pytest.mark.parametrize("titles", [
+        ["Intro to RAG"],
+        ["Intro to RAG", "MCP Course"],
+        ["Course A", "Course B", "Course C"],
+        [],
+    ], ids=["one", "two", "three", "empty_catalog"])
+    def test_returns_course_count_and_titles(self, api_client, mock_rag_system, titles):
         mock_rag_system.get_course_analytics.return_value = {
-            "total_courses": 0,
-            "course_titles": [],
+            "total_courses": len(titles),
+            "course_titles": titles,
         }
 
         response = api_client.get("/api/courses")
         data = response.json()
 
-        assert data["total_courses"] == 0
-        assert data["course_titles"] == []
+        assert response.status_code == 200
+        assert data["total_courses"] == len(titles)
+        assert data["course_titles"] == titles
 
     def test_returns_500_when_analytics_raises(self, api_client, mock_rag_system):
         mock_rag_system.get_course_analytics.side_effect = RuntimeError("ChromaDB unavailable")
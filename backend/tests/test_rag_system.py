@@ -4,40 +4,50 @@ Unit tests for RAGSystem.query() in rag_system.py.
 VectorStore, AIGenerator, and DocumentProcessor are all patched at import
 time so no real models, databases, or API calls are made.
 """
+import asyncio
+
 import pytest
-from unittest.mock import MagicMock, patch, call
+from unittest.mock import ANY, AsyncMock, MagicMock, Mock, call
+
+from search_tools import ToolManager
+from session_manager import SessionManager
+from vector_store import SearchResults
+
+pytestmark = pytest.mark.asyncio
 
 
 # ---------------------------------------------------------------------------
 # Patch heavy dependencies before importing RAGSystem
 # ---------------------------------------------------------------------------
 
-@pytest.fixture(autouse=True)
-def patch_heavy_imports():
+@pytest.fixture(scope="module")
+def _heavy_import_mocks():
     """
-    Patch VectorStore and AIGenerator constructors so RAGSystem.__init__
-    never instantiates real objects (which would load models, connect to DB, etc.).
+    Patch VectorStore, AIGenerator and DocumentProcessor constructors once for
+    the module so RAGSystem.__init__ never instantiates real objects (which
+    would load models, connect to DB, etc.).
     """
-    with patch("rag_system.VectorStore") as mock_vs_cls, \
-         patch("rag_system.AIGenerator") as mock_ai_cls, \
-         patch("rag_system.DocumentProcessor") as mock_dp_cls:
+    mocks = {
+        "vector_store": MagicMock(),
+        "ai_generator": MagicMock(),
+        "document_processor": MagicMock(),
+    }
+    mocks["ai_generator"].generate_response = AsyncMock()
 
-        # Sensible defaults for the mocked instances
-        mock_vs = MagicMock()
-        mock_vs_cls.return_value = mock_vs
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr("rag_system.VectorStore", MagicMock(return_value=mocks["vector_store"]))
+        mp.setattr("rag_system.AIGenerator", MagicMock(return_value=mocks["ai_generator"]))
+        mp.setattr("rag_system.DocumentProcessor", MagicMock(return_value=mocks["document_processor"]))
+        yield mocks
 
-        mock_ai = MagicMock()
-        mock_ai.generate_response.return_value = "Mocked AI answer"
-        mock_ai_cls.return_value = mock_ai
 
-        mock_dp = MagicMock()
-        mock_dp_cls.return_value = mock_dp
-
-        yield {
-            "vector_store": mock_vs,
-            "ai_generator": mock_ai,
-            "document_processor": mock_dp,
-        }
+@pytest.fixture(autouse=True)
+def patch_heavy_imports(_heavy_import_mocks):
+    """The module's constructor mocks, reset to sensible defaults for each test."""
+    for mock in _heavy_import_mocks.values():
+        mock.reset_mock(return_value=True, side_effect=True)
+    _heavy_import_mocks["ai_generator"].generate_response.return_value = "Mocked AI answer"
+    return _heavy_import_mocks
 
 
 # ---------------------------------------------------------------------------
@@ -55,12 +65,42 @@ def _make_config():
     cfg.EMBEDDING_MODEL = "all-MiniLM-L6-v2"
     cfg.ANTHROPIC_API_KEY = "sk-ant-test"
     cfg.ANTHROPIC_MODEL = "claude-test"
+    cfg.SUMMARY_MODEL = "claude-test-summary"
     return cfg
 
 
-def _make_rag():
+@pytest.fixture(scope="module")
+def _rag_system(_heavy_import_mocks):
     from rag_system import RAGSystem
-    return RAGSystem(_make_config())
+    rag = RAGSystem(_make_config())
+
+    # Tests configure and inspect these collaborators, so they are spec'd
+    # mocks that can be set up in place and reset between tests. Every query
+    # gets the same tool manager mock from the per-query factory.
+    rag._new_tool_manager = Mock(return_value=Mock(spec=ToolManager))
+    rag.session_manager = Mock(spec=SessionManager)
+    return rag
+
+
+@pytest.fixture
+def rag(_rag_system):
+    """
+    The module's shared RAGSystem, with its tool and session manager mocks
+    reset: no sources and no conversation history unless a test says otherwise.
+    """
+    tool_manager = _rag_system._new_tool_manager.return_value
+    _rag_system._new_tool_manager.reset_mock()
+    tool_manager.reset_mock(return_value=True, side_effect=True)
+    _rag_system.session_manager.reset_mock(return_value=True, side_effect=True)
+    tool_manager.get_last_sources.return_value = []
+    _rag_system.session_manager.get_conversation_history.return_value = None
+    return _rag_system
+
+
+@pytest.fixture
+def tool_manager(rag):
+    """The ToolManager mock handed to each of rag's queries."""
+    return rag._new_tool_manager.return_value
 
 
 # ---------------------------------------------------------------------------
@@ -68,16 +108,17 @@ def _make_rag():
 # ---------------------------------------------------------------------------
 
 class TestQueryCallsAIGenerator:
-    def test_query_calls_ai_generator_with_tool_definitions(self, patch_heavy_imports):
-        rag = _make_rag()
+    async def test_query_calls_ai_generator_with_tool_definitions(self, patch_heavy_imports, rag, tool_manager):
         mock_ai = patch_heavy_imports["ai_generator"]
 
-        rag.query("What is RAG?")
+        await rag.query("What is RAG?")
 
-        mock_ai.generate_response.assert_called_once()
-        call_kwargs = mock_ai.generate_response.call_args[1]
-        assert "tools" in call_kwargs
-        assert "tool_manager" in call_kwargs
+        mock_ai.generate_response.assert_called_once_with(
+            query=ANY,
+            conversation_history=None,
+            tools=tool_manager.get_tool_definitions(),
+            tool_manager=tool_manager,
+        )
 
 
 # ---------------------------------------------------------------------------
@@ -85,25 +126,23 @@ class TestQueryCallsAIGenerator:
 # ---------------------------------------------------------------------------
 
 class TestQueryReturnValue:
-    def test_query_returns_answer_and_sources_tuple(self, patch_heavy_imports):
+    async def test_query_returns_answer_and_sources_tuple(self, patch_heavy_imports, rag, tool_manager):
         patch_heavy_imports["ai_generator"].generate_response.return_value = "Some answer"
 
-        rag = _make_rag()
         # Inject known sources into the search tool
-        rag.tool_manager.get_last_sources = MagicMock(return_value=[{"title": "Course A"}])
+        tool_manager.get_last_sources.return_value = [{"title": "Course A"}]
 
-        result = rag.query("Explain vectors")
+        result = await rag.query("Explain vectors")
 
         assert isinstance(result, tuple)
         answer, sources = result
         assert isinstance(answer, str)
         assert isinstance(sources, list)
 
-    def test_answer_matches_ai_generator_output(self, patch_heavy_imports):
+    async def test_answer_matches_ai_generator_output(self, patch_heavy_imports, rag):
         patch_heavy_imports["ai_generator"].generate_response.return_value = "Specific answer text"
 
-        rag = _make_rag()
-        answer, _ = rag.query("Any question")
+        answer, _ = await rag.query("Any question")
 
         assert answer == "Specific answer text"
 
@@ -113,23 +152,51 @@ class TestQueryReturnValue:
 # ---------------------------------------------------------------------------
 
 class TestSourceManagement:
-    def test_sources_retrieved_then_reset_per_query(self, patch_heavy_imports):
-        rag = _make_rag()
-        rag.tool_manager.get_last_sources = MagicMock(return_value=[])
-        rag.tool_manager.reset_sources = MagicMock()
-
-        rag.query("Any question")
+    async def test_each_query_reads_sources_from_its_own_tool_manager(self, patch_heavy_imports, rag,
+                                                                     tool_manager):
+        await rag.query("First question")
+        await rag.query("Second question")
 
-        rag.tool_manager.get_last_sources.assert_called_once()
-        rag.tool_manager.reset_sources.assert_called_once()
+        assert rag._new_tool_manager.call_count == 2
+        assert tool_manager.get_last_sources.call_count == 2
 
-    def test_sources_returned_from_get_last_sources(self, patch_heavy_imports):
+    async def test_concurrent_queries_keep_their_own_sources(self, patch_heavy_imports):
+        """
+        Queries interleave at every await. Each one searches, yields to the
+        other, then reads its sources; neither may see the other's sources.
+        """
+        from rag_system import RAGSystem
+        rag = RAGSystem(_make_config())  # real per-query tool managers
+        rag.session_manager = Mock(spec=SessionManager)
+
+        def search(query, course_name=None, lesson_number=None):
+            return SearchResults(documents=[f"About {query}"],
+                                 metadata=[{"course_title": f"Course {query}", "lesson_number": 1}],
+                                 distances=[0.1])
+        store = patch_heavy_imports["vector_store"]
+        store.search.side_effect = search
+        store.get_lesson_link.return_value = None
+
+        async def generate_response(query, conversation_history, tools, tool_manager):
+            topic = query[-1]
+            tool_manager.execute_tool("search_course_content", query=topic)
+            await asyncio.sleep(0)
+            return f"answer {topic}"
+        patch_heavy_imports["ai_generator"].generate_response.side_effect = generate_response
+
+        results = await asyncio.gather(rag.query("A"), rag.query("B"))
+
+        assert results == [
+            ("answer A", [{"title": "Course A", "lesson_number": 1, "url": None}]),
+            ("answer B", [{"title": "Course B", "lesson_number": 1, "url": None}]),
+        ]
+
+    async def test_sources_returned_from_get_last_sources(self, patch_heavy_imports, rag, tool_manager):
         expected_sources = [{"title": "RAG Course", "lesson_number": 2, "url": None}]
 
-        rag = _make_rag()
-        rag.tool_manager.get_last_sources = MagicMock(return_value=expected_sources)
+        tool_manager.get_last_sources.return_value = expected_sources
 
-        _, sources = rag.query("What does lesson 2 cover?")
+        _, sources = await rag.query("What does lesson 2 cover?")
 
         assert sources == expected_sources
 
@@ -139,43 +206,37 @@ class TestSourceManagement:
 # ---------------------------------------------------------------------------
 
 class TestSessionHandling:
-    def test_session_history_passed_when_session_exists(self, patch_heavy_imports):
+    async def test_session_history_passed_when_session_exists(self, patch_heavy_imports, rag):
         mock_ai = patch_heavy_imports["ai_generator"]
 
-        rag = _make_rag()
-        rag.session_manager.get_conversation_history = MagicMock(return_value="User: Hi\nAssistant: Hello")
+        rag.session_manager.get_conversation_history.return_value = "User: Hi\nAssistant: Hello"
 
-        rag.query("Follow up", session_id="session-abc")
+        await rag.query("Follow up", session_id="session-abc")
 
-        call_kwargs = mock_ai.generate_response.call_args[1]
-        assert call_kwargs.get("conversation_history") == "User: Hi\nAssistant: Hello"
+        mock_ai.generate_response.assert_called_once_with(
+            query=ANY, conversation_history="User: Hi\nAssistant: Hello", tools=ANY, tool_manager=ANY
+        )
 
-    def test_no_history_when_session_id_is_none(self, patch_heavy_imports):
+    async def test_no_history_when_session_id_is_none(self, patch_heavy_imports, rag):
         mock_ai = patch_heavy_imports["ai_generator"]
 
-        rag = _make_rag()
-        rag.query("First question", session_id=None)
+        await rag.query("First question", session_id=None)
 
-        call_kwargs = mock_ai.generate_response.call_args[1]
-        assert call_kwargs.get("conversation_history") is None
+        mock_ai.generate_response.assert_called_once_with(
+            query=ANY, conversation_history=None, tools=ANY, tool_manager=ANY
+        )
 
-    def test_exchange_saved_to_session_after_query(self, patch_heavy_imports):
+    async def test_exchange_saved_to_session_after_query(self, patch_heavy_imports, rag):
         patch_heavy_imports["ai_generator"].generate_response.return_value = "The answer"
 
-        rag = _make_rag()
-        rag.session_manager.add_exchange = MagicMock()
-
-        rag.query("User question", session_id="session-xyz")
+        await rag.query("User question", session_id="session-xyz")
 
         rag.session_manager.add_exchange.assert_called_once_with(
             "session-xyz", "User question", "The answer"
         )
 
-    def test_no_exchange_saved_when_no_session(self, patch_heavy_imports):
-        rag = _make_rag()
-        rag.session_manager.add_exchange = MagicMock()
-
-        rag.query("Stateless question", session_id=None)
+    async def test_no_exchange_saved_when_no_session(self, patch_heavy_imports, rag):
+        await rag.query("Stateless question", session_id=None)
 
         rag.session_manager.add_exchange.assert_not_called()
 
@@ -185,7 +246,7 @@ class TestSessionHandling:
 # ---------------------------------------------------------------------------
 
 class TestErrorResilience:
-    def test_search_error_does_not_raise_exception(self, patch_heavy_imports):
+    async def test_search_error_does_not_raise_exception(self, patch_heavy_imports, rag):
         """
         Even when the tool returns an error string (e.g. from MAX_RESULTS=0),
         RAGSystem.query() should complete without raising an exception.
@@ -196,10 +257,75 @@ class TestErrorResilience:
             "I was unable to find specific content."
         )
 
-        rag = _make_rag()
-
         # Should not raise
-        answer, sources = rag.query("Course question that triggers search error")
+        answer, sources = await rag.query("Course question that triggers search error")
 
         assert isinstance(answer, str)
         assert isinstance(sources, list)
+
+
+# ---------------------------------------------------------------------------
+# query_stream()
+# ---------------------------------------------------------------------------
+
+def _stream_of(*chunks):
+    """side_effect for generate_response_stream: yields the given text chunks."""
+    async def generate_response_stream(**kwargs):
+        for chunk in chunks:
+            yield chunk
+    return generate_response_stream
+
+
+class TestQueryStream:
+    async def _collect(self, rag, *args, **kwargs):
+        return [event async for event in rag.query_stream(*args, **kwargs)]
+
+    async def test_yields_deltas_then_done_with_sources(self, patch_heavy_imports, rag, tool_manager):
+        patch_heavy_imports["ai_generator"].generate_response_stream.side_effect = _stream_of("RAG ", "answer")
+        expected_sources = [{"title": "RAG Course", "lesson_number": 1, "url": None}]
+
+        tool_manager.get_last_sources.return_value = expected_sources
+
+        events = await self._collect(rag, "What is RAG?")
+
+        assert events == [
+            {"type": "delta", "text": "RAG "},
+            {"type": "delta", "text": "answer"},
+            {"type": "done", "sources": expected_sources},
+        ]
+
+    async def test_full_answer_saved_to_session(self, patch_heavy_imports, rag):
+        patch_heavy_imports["ai_generator"].generate_response_stream.side_effect = _stream_of("The ", "answer")
+
+        await self._collect(rag, "User question", session_id="session-xyz")
+
+        rag.session_manager.add_exchange.assert_called_once_with(
+            "session-xyz", "User question", "The answer"
+        )
+
+    async def test_discarded_preamble_not_saved_to_session(self, patch_heavy_imports, rag):
+        patch_heavy_imports["ai_generator"].generate_response_stream.side_effect = _stream_of(
+            "Let me check. ", None, "The ", "answer"
+        )
+
+        events = await self._collect(rag, "User question", session_id="session-xyz")
+
+        assert {"type": "discard"} in events
+        rag.session_manager.add_exchange.assert_called_once_with(
+            "session-xyz", "User question", "The answer"
+        )
+
+    async def test_stream_called_with_tools_and_history(self, patch_heavy_imports, rag, tool_manager):
+        mock_ai = patch_heavy_imports["ai_generator"]
+        mock_ai.generate_response_stream.side_effect = _stream_of("ok")
+
+        rag.session_manager.get_conversation_history.return_value = "User: Hi"
+
+        await self._collect(rag, "Follow up", session_id="session-abc")
+
+        mock_ai.generate_response_stream.assert_called_once_with(
+            query=ANY,
+            conversation_history="User: Hi",
+            tools=tool_manager.get_tool_definitions(),
+            tool_manager=tool_manager,
+        )
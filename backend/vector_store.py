@@ -1,9 +1,10 @@
-import chromadb
-from chromadb.config import Settings
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass
 from models import Course, CourseChunk
-from sentence_transformers import SentenceTransformer
+
+# chromadb (and the sentence-transformers model behind its embedding function)
+# is imported when the first VectorStore is built, so modules that only need
+# SearchResults, and tests that mock VectorStore, don't pay for it
 
 @dataclass
 class SearchResults:
@@ -35,6 +36,10 @@ class VectorStore:
     """Vector storage using ChromaDB for course content and metadata"""
     
     def __init__(self, chroma_path: str, embedding_model: str, max_results: int = 5):
+        import chromadb
+        from chromadb.config import Settings
+        from chromadb.utils import embedding_functions
+
         self.max_results = max_results
         # Initialize ChromaDB client
         self.client = chromadb.PersistentClient(
@@ -43,7 +48,7 @@ class VectorStore:
         )
         
         # Set up sentence transformer embedding function
-        self.embedding_function = chromadb.utils.embedding_functions.SentenceTransformerEmbeddingFunction(
+        self.embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
             model_name=embedding_model
         )
         
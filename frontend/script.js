@@ -82,7 +82,7 @@ async function sendMessage() {
     chatMessages.scrollTop = chatMessages.scrollHeight;
 
     try {
-        const response = await fetch(`${API_URL}/query`, {
+        const response = await fetch(`${API_URL}/query/stream`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -95,17 +95,50 @@ async function sendMessage() {
 
         if (!response.ok) throw new Error('Query failed');
 
-        const data = await response.json();
-        
-        // Update session ID if new
-        if (!currentSessionId) {
-            currentSessionId = data.session_id;
+        // Read newline-delimited JSON events, rendering the answer as it arrives
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let answer = '';
+        let streamingContent = null;
+        const loadingHTML = loadingMessage.innerHTML;
+
+        const handleEvent = (event) => {
+            if (event.type === 'delta') {
+                answer += event.text;
+                if (!streamingContent) {
+                    loadingMessage.innerHTML = '<div class="message-content"></div>';
+                    streamingContent = loadingMessage.querySelector('.message-content');
+                }
+                streamingContent.innerHTML = marked.parse(answer);
+                chatMessages.scrollTop = chatMessages.scrollHeight;
+            } else if (event.type === 'discard') {
+                // Text so far only led up to a tool call; show loading until the answer streams
+                answer = '';
+                streamingContent = null;
+                loadingMessage.innerHTML = loadingHTML;
+            } else if (event.type === 'done') {
+                // Update session ID if new
+                if (!currentSessionId) {
+                    currentSessionId = event.session_id;
+                }
+                // Replace streamed message with the final one, including sources
+                loadingMessage.remove();
+                addMessage(answer, 'assistant', event.sources);
+            } else if (event.type === 'error') {
+                throw new Error(event.detail || 'Query failed');
+            }
+        };
+
+        for (;;) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            lines.filter((line) => line.trim()).forEach((line) => handleEvent(JSON.parse(line)));
         }
-
-        // Replace loading message with response
-        loadingMessage.remove();
-        addMessage(data.answer, 'assistant', data.sources);
-
+        if (buffer.trim()) handleEvent(JSON.parse(buffer));
     } catch (error) {
         // Replace loading message with error
         loadingMessage.remove();